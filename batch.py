@@ -0,0 +1,118 @@
+import argparse
+import concurrent.futures
+import csv
+import glob
+import os
+import sys
+import time
+import numpy as np
+import curvelet
+import process
+
+def wedge_index(token):
+    try:
+        i,j = token.split(',')
+        return (int(i),None if j.strip() == '*' else int(j))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid wedge '{}', expected I,J or I,*".format(token))
+
+def collect_files(inputs,image_worker):
+    supported = image_worker.supportedRawFormats | image_worker.supportedImageFormats
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item,name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+        files.extend(path for path in candidates if os.path.isfile(path) and os.path.splitext(path)[1] in supported)
+    return sorted(set(files))
+
+def init_worker(inner_workers):
+    curvelet.fft_workers = inner_workers
+    process.Image.decode_cache_size = 0
+
+def denoise_file(path,options):
+    timings = {'file':path,'status':'ok'}
+    start = time.perf_counter()
+    try:
+        image_worker = process.Image(options['luminance'])
+        img_array = image_worker.get_image(options['bit_depth'],path,options['auto_wb'],options['brightness'],\
+            options['black_level'],options['crop'])
+        timings['decode'] = time.perf_counter()-start
+        denoiser = process.CurveletDenoiser(options['nbs'],options['nba'],options['ac'],options['threshold'],\
+            options['wedges'],options['mode'],options['backend'])
+        if options['tile']:
+            denoiser = process.TiledDenoiser(denoiser,options['tile'],options['overlap'],options['tile_workers'])
+            image_denoised = denoiser.run(img_array,timings)
+        else:
+            image_denoised = denoiser.run(image_worker.nparray2pilImg(img_array),timings)
+        write_start = time.perf_counter()
+        name = os.path.splitext(os.path.basename(path))[0]+'_denoised.'+options['format']
+        output = os.path.join(options['output'],name)
+        if options['format'] == 'npy':
+            np.save(output,image_denoised)
+        else:
+            image_worker.nparray2pilImg(np.uint8(np.clip(image_denoised,0,255))).save(output)
+        timings['write'] = time.perf_counter()-write_start
+        timings['output'] = output
+    except Exception as error:
+        timings['status'] = 'error: {}'.format(error)
+    timings['total'] = time.perf_counter()-start
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless curvelet threshold denoise of RAW/image files.')
+    parser.add_argument('inputs',nargs='+',help='directories, files or glob patterns')
+    parser.add_argument('-o','--output',default='./denoised',help='output directory')
+    parser.add_argument('--nbs',type=int,default=5,help='number of scales')
+    parser.add_argument('--nba',type=int,default=8,help='number of angles at the second coarsest scale')
+    parser.add_argument('--no-ac',dest='ac',action='store_false',help='use wavelets at the finest scale')
+    parser.add_argument('--backend',choices=curvelet.available_backends(),default=curvelet.default_backend(),help='curvelet transform backend')
+    parser.add_argument('--threshold',type=float,default=30,help='threshold in units of the wedge energy')
+    parser.add_argument('--mode',choices=process.ThresholdEngine.MODES,default='hard')
+    parser.add_argument('--wedges',type=wedge_index,nargs='*',metavar='I,J',help='wedges to threshold, e.g. 2,5 or 3,* for a whole scale (default: all)')
+    parser.add_argument('--crop',type=int,nargs=4,metavar=('Y0','Y1','X0','X1'),help='crop of RAW frames (default: full frame)')
+    parser.add_argument('--bit-depth',type=int,choices=(8,16),default=16)
+    parser.add_argument('--auto-wb',action='store_true',help='use the camera auto white balance')
+    parser.add_argument('--brightness',type=float,default=20)
+    parser.add_argument('--black-level',type=int,default=50)
+    parser.add_argument('--luminance',choices=('float32','fixed'),default='float32',help='precision of the luminance weighted sum')
+    parser.add_argument('--tile',type=int,default=0,help='denoise in overlapping tiles of this size (default: whole image)')
+    parser.add_argument('--overlap',type=int,default=128,help='overlap between neighbouring tiles')
+    parser.add_argument('--tile-workers',type=int,default=1,help='threads per file used for the tiles (only with --workers 1)')
+    parser.add_argument('--format',choices=('png','tiff','npy'),default='png')
+    parser.add_argument('--workers',type=int,default=os.cpu_count(),help='number of worker processes')
+    parser.add_argument('--report',default=None,help='timing report path (default: <output>/timing.csv)')
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.inputs,process.Image())
+    if not files:
+        print('[ERROR] No supported image files found!')
+        return 1
+    os.makedirs(args.output,exist_ok=True)
+    options = {'bit_depth':args.bit_depth,'auto_wb':args.auto_wb,'brightness':args.brightness,'black_level':args.black_level,\
+        'crop':args.crop,'nbs':args.nbs,'nba':args.nba,'ac':args.ac,'backend':args.backend,'threshold':args.threshold,\
+        'wedges':set(args.wedges or []),'mode':args.mode,'format':args.format,'output':args.output,\
+        'luminance':args.luminance,'tile':args.tile,'overlap':args.overlap,'tile_workers':args.tile_workers if args.workers <= 1 else 1}
+    fields = ['file','status','tiles','decode','forward','threshold','inverse','write','total','output']
+    report = args.report or os.path.join(args.output,'timing.csv')
+    start = time.perf_counter()
+    failures = 0
+    with open(report,'w',newline='') as report_file, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=max(1,args.workers),initializer=init_worker,\
+                initargs=(-1 if args.workers <= 1 else 1,)) as executor:
+        writer = csv.DictWriter(report_file,fieldnames=fields,restval='')
+        writer.writeheader()
+        futures = [executor.submit(denoise_file,path,options) for path in files]
+        for count,future in enumerate(concurrent.futures.as_completed(futures),1):
+            timings = future.result()
+            writer.writerow({key:('{:.4f}'.format(value) if isinstance(value,float) else value) for key,value in timings.items()})
+            report_file.flush()
+            if timings['status'] != 'ok':
+                failures += 1
+            print('[{}/{}] {} ({:.2f} s) {}'.format(count,len(files),timings['file'],timings['total'],timings['status']))
+    print('[SUCCESS] {} file(s) processed in {:.2f} s, {} failed. Timing report: {}'.format(len(files),time.perf_counter()-start,failures,report))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
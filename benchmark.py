@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import curvelet
+import process
+
+def synthetic_image(size,seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[0:size,0:size]
+    period = max(size/16,4)
+    image = 128+48*np.sin(2*np.pi*x/period)*np.cos(2*np.pi*y/(1.7*period))
+    image = image+40*(((x-size/2)**2+(y-size/2)**2) < (size/4)**2)
+    image += rng.normal(0,12,(size,size))
+    return np.clip(image,0,255)
+
+def measure(function,repeat,setup=None):
+    arguments = (setup(),) if setup else ()
+    tracemalloc.start()
+    function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(max(repeat,1)):
+        arguments = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = function(*arguments)
+        times.append(time.perf_counter()-start)
+    return result, {'best':min(times),'median':statistics.median(times),'runs':len(times),'peak_mb':peak/2**20}
+
+def threshold_all(engine,coefficients,threshold,mode):
+    ids = engine.select(None)
+    denoised = np.array(coefficients)
+    denoised[engine.layout.indices(ids)] = engine.threshold(coefficients,threshold,ids,mode)
+    return denoised
+
+def benchmark_case(size,nbs,nba,ac,backend,threshold,mode,repeat,render):
+    stages = {}
+    image_worker = process.Image()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory,'synthetic.png')
+        image_worker.nparray2pilImg(np.repeat(np.uint8(synthetic_image(size))[:,:,None],3,axis=2)).save(path)
+        decode_cache_size = process.Image.decode_cache_size
+        process.Image.decode_cache_size = 0
+        try:
+            image, stages['load'] = measure(lambda: image_worker.get_image(8,path,False,20,50,None),repeat)
+            _, stages['load_preview'] = measure(lambda: image_worker.get_image(8,path,False,20,50,None,preview=True),repeat)
+        finally:
+            process.Image.decode_cache_size = decode_cache_size
+    image = np.asarray(image,dtype=np.float64)
+    plan, stages['plan'] = measure(lambda: process.CurveletPlan((size,size),nbs,nba,ac,backend),repeat)
+    coefficients, stages['forward'] = measure(lambda: plan.fdct.fwd(image),repeat)
+    normstruct, stages['normstruct'] = measure(lambda fdct: fdct.normstruct(),repeat,\
+        lambda: curvelet.create_fdct(backend,(size,size),nbs,nba,ac))
+    engine = process.ThresholdEngine(plan.layout(len(coefficients)),normstruct)
+    _, stages['statistics'] = measure(lambda: process.WedgeStatistics(engine.layout,coefficients),repeat)
+    denoised, stages['threshold'] = measure(lambda: threshold_all(engine,coefficients,threshold,mode),repeat)
+    image_denoised, stages['inverse'] = measure(lambda: plan.fdct.inv(denoised),repeat)
+    if render:
+        import dynamic_viewer
+        _, stages['display'] = measure(lambda: image_worker.nparray2qPixImg(image_worker.window_level(image_denoised)),repeat)
+        wedge = process.CoefficientBuffer(coefficients,engine.layout)[1][0]
+        viewer = dynamic_viewer.DynamicViewer(wedge,'Monospace',5,'bwr',True)
+        _, stages['wedge_plot'] = measure(lambda: (viewer.replot(wedge,'bwr'),viewer.figure.draw()),repeat)
+        viewer.close()
+        viewer.deleteLater()
+    return stages
+
+def git_commit():
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],cwd=os.path.dirname(os.path.abspath(__file__)),\
+            capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def compare(results,baseline,tolerance):
+    previous = {(row['size'],row['nbs'],row['nba'],row['ac'],row.get('backend','pyct'),row['stage']):row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        key = (row['size'],row['nbs'],row['nba'],row['ac'],row['backend'],row['stage'])
+        if key in previous and previous[key]['best'] > 0:
+            ratio = row['best']/previous[key]['best']
+            print('{:>6} nbs={} nba={} {:<8} {:<11} {:9.4f} s -> {:9.4f} s  x{:.2f}'.format(key[0],key[1],key[2],key[4],key[5],\
+                previous[key]['best'],row['best'],ratio))
+            if ratio > tolerance:
+                regressions.append(key)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the curvelet pipeline stages on synthetic images.')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[512,1024,2048],help='image sizes, up to 8192')
+    parser.add_argument('--nbs',type=int,nargs='+',default=[4,5,6],help='numbers of scales')
+    parser.add_argument('--nba',type=int,nargs='+',default=[16,32],help='numbers of angles at the second coarsest scale')
+    parser.add_argument('--no-ac',dest='ac',action='store_false',help='use wavelets at the finest scale')
+    parser.add_argument('--backend',choices=curvelet.available_backends(),default=curvelet.default_backend(),help='curvelet transform backend')
+    parser.add_argument('--check',action='store_true',help='compare the wrapping backend against pyct before timing')
+    parser.add_argument('--threshold',type=float,default=30)
+    parser.add_argument('--mode',choices=process.ThresholdEngine.MODES,default='hard')
+    parser.add_argument('--repeat',type=int,default=3,help='timed runs per stage after the memory-traced run')
+    parser.add_argument('--no-render',dest='render',action='store_false',help='skip the offscreen Qt display and wedge plot stages')
+    parser.add_argument('-o','--output',default='benchmark.json',help='JSON results path')
+    parser.add_argument('--compare',default=None,help='baseline JSON results to compare against')
+    parser.add_argument('--tolerance',type=float,default=1.2,help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.render:
+        os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+        from PyQt5 import QtWidgets
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    results = []
+    if args.check:
+        for size in args.sizes:
+            for nbs in args.nbs:
+                for nba in args.nba:
+                    report = curvelet.compare_with_pyct((size,size),nbs,nba,args.ac,synthetic_image(size))
+                    if report is None:
+                        print('[ERROR] pyct is not installed, nothing to compare against!')
+                        return 1
+                    print('{:>6} nbs={} nba={}: '.format(size,nbs,nba)+', '.join('{} {}'.format(key,value) for key,value in report.items()))
+    for size in args.sizes:
+        for nbs in args.nbs:
+            for nba in args.nba:
+                if size < 2**(nbs+2):
+                    print('[ERROR] Skipped size {} with nbs={}: image too small!'.format(size,nbs))
+                    continue
+                stages = benchmark_case(size,nbs,nba,args.ac,args.backend,args.threshold,args.mode,args.repeat,args.render)
+                for stage,timing in stages.items():
+                    results.append(dict(size=size,nbs=nbs,nba=nba,ac=args.ac,backend=args.backend,stage=stage,**timing))
+                print('{:>6} nbs={} nba={}: '.format(size,nbs,nba)+', '.join('{} {:.4f} s ({:.1f} MB)'.format(stage,\
+                    timing['best'],timing['peak_mb']) for stage,timing in stages.items()))
+    metadata = {'commit':git_commit(),'time':time.strftime('%Y-%m-%dT%H:%M:%S'),'python':platform.python_version(),\
+        'numpy':np.__version__,'platform':platform.platform(),'processor':platform.processor(),'cpus':os.cpu_count(),\
+        'threshold':args.threshold,'mode':args.mode,'repeat':args.repeat}
+    with open(args.output,'w') as output:
+        json.dump({'metadata':metadata,'results':results},output,indent=1)
+    print('[SUCCESS] {} stage timings written to {}'.format(len(results),args.output))
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results,json.load(baseline),args.tolerance)
+        if regressions:
+            print('[ERROR] {} stage(s) slower than x{} of the baseline!'.format(len(regressions),args.tolerance))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,376 @@
+import functools
+import numpy as np
+import scipy.fft
+try:
+    import pyct
+except ImportError:
+    pyct = None
+
+BACKENDS = ('pyct','wrapping')
+fft_workers = -1
+
+def available_backends():
+    if pyct is None:
+        return ('wrapping',)
+    return BACKENDS if layout_matches_pyct() else ('pyct',)
+
+def default_backend(preferred='pyct'):
+    return preferred if preferred in available_backends() else available_backends()[0]
+
+def create_fdct(backend,n,nbs,nba,ac):
+    if backend == 'pyct':
+        if pyct is None:
+            raise ImportError('pyct is not installed, use the wrapping backend instead')
+        return pyct.fdct2(n=n,nbs=nbs,nba=nba,ac=ac,norm=False,vec=True)
+    elif backend == 'wrapping':
+        return WrappingCurvelet(n,nbs,nba,ac)
+    raise ValueError('Unknown transform backend: {}'.format(backend))
+
+def matlab_round(x):
+    return (np.sign(x)*np.floor(np.abs(x)+0.5)).astype(np.intp)
+
+def wrapping_window(x):
+    x = np.where(np.abs(x) < 2**-52,0,x)
+    inside = (x > 0) & (x < 1)
+    wl, wr = np.zeros(x.shape), np.zeros(x.shape)
+    with np.errstate(divide='ignore',over='ignore'):
+        wr[inside] = np.exp(1-1/(1-np.exp(1-1/x[inside])))
+        wl[inside] = np.exp(1-1/(1-np.exp(1-1/(1-x[inside]))))
+    wr[x <= 0] = 1
+    wl[x >= 1] = 1
+    normalization = np.sqrt(wl**2+wr**2)
+    return wl/normalization, wr/normalization
+
+def lowpass_filter(M,shorten=False):
+    length = int(np.floor(2*M)-np.floor(M)-1-shorten)
+    coord = np.arange(length+1)/length if length > 0 else np.zeros(1)
+    wl, wr = wrapping_window(coord)
+    lowpass = np.concatenate([wl,np.ones(2*int(np.floor(M))+1),wr])
+    return np.pad(lowpass,1) if shorten else lowpass
+
+class WrappingCurvelet(object):
+
+    def __init__(self,n,nbs,nba,ac,cpx=False,workers=None):
+        super(WrappingCurvelet,self).__init__()
+        self.n = tuple(n)
+        self.shape = (int(n[1]),int(n[0]))
+        self.nbs = nbs
+        self.nba = nba
+        self.ac = ac
+        self.cpx = cpx
+        self.workers = fft_workers if workers is None else workers
+        if nba % 4 or nba < 8:
+            raise ValueError('The number of angles must be a multiple of 4 and at least 8')
+        self.nbangles = [1]+[nba*2**int(np.ceil((i-1)/2)) for i in range(1,nbs)]
+        if not ac:
+            self.nbangles[-1] = 1
+        self.build()
+        self._norms = None
+
+    def build(self):
+        N1, N2 = self.shape
+        M1, M2 = N1/3, N2/3
+        if self.ac:
+            big1, big2 = 2*int(np.floor(2*M1))+1, 2*int(np.floor(2*M2))+1
+            self.extension = ((int(np.floor(N1/2))-int(np.floor(2*M1))+np.arange(big1)) % N1,\
+                (int(np.floor(N2/2))-int(np.floor(2*M2))+np.arange(big2)) % N2)
+            self.initial_lowpass = np.outer(lowpass_filter(M1,N1 % 3 == 0),lowpass_filter(M2,N2 % 3 == 0))
+            scales = range(self.nbs-1,0,-1)
+        else:
+            M1, M2 = M1/2, M2/2
+            lowpass = np.outer(lowpass_filter(M1),lowpass_filter(M2))
+            self.finest = (self.centre(M1,M2,int(np.ceil((N1+1)/2))-1,int(np.ceil((N2+1)/2))-1),lowpass,np.sqrt(1-lowpass**2))
+            scales = range(self.nbs-2,0,-1)
+        self.scales = []
+        self.shapes = [[] for i in range(self.nbs)]
+        for i in scales:
+            M1, M2 = M1/2, M2/2
+            lowpass = np.outer(lowpass_filter(M1),lowpass_filter(M2))
+            frame = (2*int(np.floor(4*M1))+1,2*int(np.floor(4*M2))+1)
+            centre = self.centre(M1,M2,int(np.floor(4*M1)),int(np.floor(4*M2)))
+            wedges = self.wedges(i,M1,M2,frame)
+            self.shapes[i] = [index.shape for index,window in wedges]*(1 if self.cpx else 2)
+            groups = {}
+            for l,(index,window) in enumerate(wedges):
+                groups.setdefault(index.shape,[]).append(l)
+            groups = [(np.array(ls),np.stack([wedges[l][0] for l in ls]),np.stack([wedges[l][1] for l in ls])) for ls in groups.values()]
+            self.scales.append((i,frame,centre,lowpass,np.sqrt(1-lowpass**2),groups))
+        self.coarse_shape = (2*int(np.floor(2*M1))+1,2*int(np.floor(2*M2))+1)
+        self.shapes[0] = [self.coarse_shape]
+        if not self.ac:
+            self.shapes[-1] = [self.shape]
+        self.sizes = [[int(np.prod(shape)) for shape in shapes] for shapes in self.shapes]
+        self.offsets = np.cumsum([0]+[size for sizes in self.sizes for size in sizes])
+
+    def nbytes(self):
+        arrays = [array for scale in self.scales for array in scale[3:5]+tuple(array for group in scale[5] for array in group)]
+        arrays += [self.initial_lowpass,*self.extension] if self.ac else list(self.finest[1:])
+        return sum(array.nbytes for array in arrays)+self.offsets.nbytes
+
+    def centre(self,M1,M2,middle1,middle2):
+        return (slice(middle1-int(np.floor(2*M1)),middle1+int(np.floor(2*M1))+1),\
+            slice(middle2-int(np.floor(2*M2)),middle2+int(np.floor(2*M2))+1))
+
+    def wedges(self,i,M1,M2,frame):
+        quadrants = 4 if self.cpx else 2
+        per_quadrant = self.nbangles[i]//4
+        size = frame[0]*frame[1]
+        wedges = []
+        for quadrant in range(1,quadrants+1):
+            M_horiz = M2 if quadrant % 2 else M1
+            M_vert = M1 if quadrant % 2 else M2
+            for index, window in self.quadrant(quadrant,M_horiz,M_vert,per_quadrant):
+                wedges.append((np.rot90(index+(quadrant-1)*size,-(quadrant-1)),np.rot90(window,-(quadrant-1))))
+        return wedges
+
+    def gather(self,rows,left_line,first_row,first_col,width):
+        length = len(rows)
+        cols = left_line[:,None]+(np.arange(width)[None,:]-(left_line[:,None]-first_col)) % width
+        order = (rows-first_row) % length
+        wrapped_cols = np.empty((length,width),dtype=np.intp)
+        wrapped_rows = np.empty((length,width),dtype=np.intp)
+        wrapped_cols[order] = cols
+        wrapped_rows[order] = rows[:,None]
+        return wrapped_rows, wrapped_cols
+
+    def quadrant(self,quadrant,M_horiz,M_vert,per_quadrant):
+        F_h, F_v = int(np.floor(4*M_horiz)), int(np.floor(4*M_vert))
+        columns = 2*F_h+1
+        ticks_left = matlab_round(np.arange(per_quadrant+1)/(2*per_quadrant)*2*F_h+1)
+        ticks_right = 2*F_h+2-ticks_left
+        ticks = np.concatenate([ticks_left,ticks_right[-2::-1]])
+        endpoints = ticks[1:-1:2]
+        midpoints = (endpoints[:-1]+endpoints[1:])/2
+        shift_row = int(quadrant in (2,3))
+        shift_col = int(quadrant in (3,4))
+        first_vert = int(matlab_round(2*F_v/(2*per_quadrant)+1))
+        corner_length = F_v-int(np.floor(M_vert))+int(np.ceil(first_vert/4))
+        rows = np.arange(1,corner_length+1)
+        first_row = F_v+2-int(np.ceil((corner_length+1)/2))+((corner_length+1) % 2)*shift_row
+
+        # left corner wedge
+        width = endpoints[1]+endpoints[0]-1
+        slope = (F_h+1-endpoints[0])/F_v
+        left_line = matlab_round(2-endpoints[0]+slope*(rows-1))
+        first_col = F_h+2-int(np.ceil((width+1)/2))+((width+1) % 2)*shift_col
+        YY, cols = self.gather(rows,left_line,first_row,first_col,width)
+        mask = cols > 0
+        XX = np.maximum(cols,1).astype(np.float64)
+        index = (YY-1)*columns+np.maximum(cols,1)-1
+        slope_right = (F_h+1-midpoints[0])/F_v
+        coord_right = 1/2+F_v/(endpoints[1]-endpoints[0])*(XX-(midpoints[0]+slope_right*(YY-1)))/(F_v+1-YY)
+        C2 = 1/(1/(2*F_h/(endpoints[0]-1)-1)+1/(2*F_v/(first_vert-1)-1))
+        C1 = C2/(2*F_v/(first_vert-1)-1)
+        XX[(XX-1)/F_h+(YY-1)/F_v == 2] += 1
+        with np.errstate(divide='ignore',invalid='ignore'):
+            coord_corner = C1+C2*((XX-1)/F_h-(YY-1)/F_v)/(2-((XX-1)/F_h+(YY-1)/F_v))
+        yield index, wrapping_window(coord_corner)[0]*wrapping_window(coord_right)[1]*mask
+
+        # regular wedges
+        length = F_v-int(np.floor(M_vert))
+        rows = np.arange(1,length+1)
+        first_row = F_v+2-int(np.ceil((length+1)/2))+((length+1) % 2)*shift_row
+        for l in range(1,per_quadrant-1):
+            width = endpoints[l+1]-endpoints[l-1]+1
+            slope = (F_h+1-endpoints[l])/F_v
+            left_line = matlab_round(endpoints[l-1]+slope*(rows-1))
+            first_col = F_h+2-int(np.ceil((width+1)/2))+((width+1) % 2)*shift_col
+            YY, cols = self.gather(rows,left_line,first_row,first_col,width)
+            XX = cols.astype(np.float64)
+            slope_left = (F_h+1-midpoints[l-1])/F_v
+            coord_left = 1/2+F_v/(endpoints[l]-endpoints[l-1])*(XX-(midpoints[l-1]+slope_left*(YY-1)))/(F_v+1-YY)
+            slope_right = (F_h+1-midpoints[l])/F_v
+            coord_right = 1/2+F_v/(endpoints[l+1]-endpoints[l])*(XX-(midpoints[l]+slope_right*(YY-1)))/(F_v+1-YY)
+            yield (YY-1)*columns+cols-1, wrapping_window(coord_left)[0]*wrapping_window(coord_right)[1]
+
+        # right corner wedge
+        rows = np.arange(1,corner_length+1)
+        first_row = F_v+2-int(np.ceil((corner_length+1)/2))+((corner_length+1) % 2)*shift_row
+        width = 4*F_h+3-endpoints[-1]-endpoints[-2]
+        slope = (F_h+1-endpoints[-1])/F_v
+        left_line = matlab_round(endpoints[-2]+slope*(rows-1))
+        first_col = F_h+2-int(np.ceil((width+1)/2))+((width+1) % 2)*shift_col
+        YY, cols = self.gather(rows,left_line,first_row,first_col,width)
+        mask = cols <= columns
+        XX = np.minimum(cols,columns).astype(np.float64)
+        index = (YY-1)*columns+np.minimum(cols,columns)-1
+        slope_left = (F_h+1-midpoints[-1])/F_v
+        coord_left = 1/2+F_v/(endpoints[-1]-endpoints[-2])*(XX-(midpoints[-1]+slope_left*(YY-1)))/(F_v+1-YY)
+        C2 = -1/(2*F_h/(endpoints[-1]-1)-1+1/(2*F_v/(first_vert-1)-1))
+        C1 = -C2*(2*F_h/(endpoints[-1]-1)-1)
+        XX[(XX-1)/F_h == (YY-1)/F_v] -= 1
+        with np.errstate(divide='ignore',invalid='ignore'):
+            coord_corner = C1+C2*(2-((XX-1)/F_h+(YY-1)/F_v))/((XX-1)/F_h-(YY-1)/F_v)
+        yield index, wrapping_window(coord_left)[0]*wrapping_window(coord_corner)[1]*mask
+
+    def spectrum(self,x):
+        return scipy.fft.fftshift(scipy.fft.fft2(scipy.fft.ifftshift(x,axes=(-2,-1)),norm='ortho',workers=self.workers),axes=(-2,-1))
+
+    def signal(self,X):
+        return scipy.fft.fftshift(scipy.fft.ifft2(scipy.fft.ifftshift(X,axes=(-2,-1)),norm='ortho',workers=self.workers),axes=(-2,-1))
+
+    def fwd(self,image):
+        x = np.asarray(image,dtype=np.float64)
+        if x.shape != self.shape:
+            raise ValueError('Expected an image of shape {}, got {}'.format(self.shape,x.shape))
+        X = self.spectrum(x)
+        structure = [[None]*count for count in self.nbangles]
+        if self.ac:
+            Xlow = X[np.ix_(*self.extension)]*self.initial_lowpass
+        else:
+            centre, lowpass, hipass = self.finest
+            Xlow = X[centre]*lowpass
+            X[centre] *= hipass
+            structure[-1][0] = self.signal(X)
+        for i,frame,centre,lowpass,hipass,groups in self.scales:
+            Xhi = Xlow
+            Xlow = Xhi[centre].copy()
+            Xhi[centre] *= hipass
+            Xlow *= lowpass
+            frames = np.concatenate([np.rot90(Xhi,k).ravel() for k in range(4 if self.cpx else 2)])
+            half = self.nbangles[i]//2
+            for ls,index,window in groups:
+                wedges = self.signal(frames[index]*window)
+                for l,wedge in zip(ls.tolist(),wedges):
+                    if self.cpx:
+                        structure[i][l] = wedge
+                    else:
+                        structure[i][l] = np.sqrt(2)*wedge.real
+                        structure[i][l+half] = np.sqrt(2)*wedge.imag
+        structure[0][0] = self.signal(Xlow)
+        if not self.cpx:
+            structure[0][0] = structure[0][0].real
+            if not self.ac:
+                structure[-1][0] = structure[-1][0].real
+        return self.vect(structure)
+
+    def inv(self,vector):
+        return self.synthesize({(i,l):wedge for i,wedges in enumerate(self.struct(vector)) for l,wedge in enumerate(wedges)})
+
+    def synthesize(self,wedges):
+        Xlow = self.spectrum(wedges[(0,0)]) if (0,0) in wedges else None
+        for i,frame,centre,lowpass,hipass,groups in reversed(self.scales):
+            Xhi = self.scatter(i,frame,groups,wedges)
+            if Xhi is None and Xlow is None:
+                continue
+            if Xhi is None:
+                Xhi = np.zeros(frame,dtype=np.complex128)
+            Xhi[centre] *= hipass
+            if Xlow is not None:
+                Xhi[centre] += Xlow*lowpass
+            Xlow = Xhi
+        if self.ac:
+            X = None
+            if Xlow is not None:
+                Xlow *= self.initial_lowpass
+                X = self.fold(self.fold(Xlow,0),1)
+        else:
+            centre, lowpass, hipass = self.finest
+            finest = (self.nbs-1,0)
+            X = self.spectrum(wedges[finest]) if finest in wedges else None
+            if X is not None:
+                X[centre] *= hipass
+            if Xlow is not None:
+                if X is None:
+                    X = np.zeros(self.shape,dtype=np.complex128)
+                X[centre] += Xlow*lowpass
+        if X is None:
+            return np.zeros(self.shape,dtype=np.complex128 if self.cpx else np.float64)
+        image = self.signal(X)
+        return image if self.cpx else image.real
+
+    def fold(self,X,axis):
+        extension, length = self.extension[axis], self.shape[axis]
+        shape = list(X.shape)
+        shape[axis] = length
+        folded = np.zeros(shape,dtype=X.dtype)
+        start = 0
+        while start < len(extension):
+            first = extension[start]
+            stop = min(len(extension),start+length-first)
+            target = [slice(None)]*X.ndim
+            source = [slice(None)]*X.ndim
+            target[axis], source[axis] = slice(first,first+stop-start), slice(start,stop)
+            folded[tuple(target)] += X[tuple(source)]
+            start = stop
+        return folded
+
+    def scatter(self,i,frame,groups,wedges):
+        half = self.nbangles[i]//2
+        count = 4 if self.cpx else 2
+        size = frame[0]*frame[1]
+        frames = None
+        for ls,index,window in groups:
+            if self.cpx:
+                members = [k for k,l in enumerate(ls.tolist()) if (i,l) in wedges]
+                data = [wedges[(i,ls[k])] for k in members]
+            else:
+                members = [k for k,l in enumerate(ls.tolist()) if (i,l) in wedges or (i,l+half) in wedges]
+                data = [wedges.get((i,ls[k]),0)+1j*wedges.get((i,ls[k]+half),0) for k in members]
+            if not members:
+                continue
+            if len(members) < len(ls):
+                index, window = index[members], window[members]
+            data = self.spectrum(np.stack(data)*(1 if self.cpx else np.sqrt(2)))
+            data = (data*window).ravel()
+            if frames is None:
+                frames = np.zeros(count*size,dtype=np.complex128)
+            if data.size < size//8:
+                np.add.at(frames,index.ravel(),data)
+            else:
+                frames += np.bincount(index.ravel(),weights=data.real,minlength=count*size)
+                frames += 1j*np.bincount(index.ravel(),weights=data.imag,minlength=count*size)
+        if frames is None:
+            return None
+        rotated = frame[::-1]
+        return sum(np.rot90(frames[k*size:(k+1)*size].reshape(rotated if k % 2 else frame),-k) for k in range(count))
+
+    def struct(self,vector):
+        structure = []
+        k = 0
+        for i in range(self.nbs):
+            structure.append([])
+            for shape in self.shapes[i]:
+                structure[i].append(np.reshape(vector[self.offsets[k]:self.offsets[k+1]],shape))
+                k += 1
+        return structure
+
+    def vect(self,structure):
+        return np.concatenate([np.ravel(wedge) for wedges in structure for wedge in wedges])
+
+    def normstruct(self):
+        if self._norms is None:
+            delta = np.zeros(self.shape)
+            delta[self.shape[0]//2,self.shape[1]//2] = np.sqrt(delta.size)
+            self._norms = [[float(np.sqrt(np.sum(np.abs(wedge)**2)/wedge.size)) for wedge in wedges] for wedges in self.struct(self.fwd(delta))]
+        return self._norms
+
+def compare_with_pyct(n,nbs,nba,ac,image=None):
+    if pyct is None:
+        return None
+    reference = create_fdct('pyct',n,nbs,nba,ac)
+    candidate = create_fdct('wrapping',n,nbs,nba,ac)
+    if image is None:
+        image = np.random.default_rng(0).normal(size=(n[1],n[0]))
+    expected = reference.struct(reference.fwd(image))
+    actual = candidate.struct(candidate.fwd(image))
+    report = {'scales':len(expected) == len(actual),'wedges':[len(row) for row in expected] == [len(row) for row in actual],\
+        'shapes':True,'mismatched':[],'transposed':0,'coefficients':0.0}
+    for i,(expected_row,actual_row) in enumerate(zip(expected,actual)):
+        for j,(a,b) in enumerate(zip(expected_row,actual_row)):
+            a, b = np.asarray(a), np.asarray(b)
+            if a.shape != b.shape:
+                report['shapes'] = False
+                report['mismatched'].append((i,j))
+                if a.shape == b.T.shape:
+                    report['transposed'] += 1
+                continue
+            report['coefficients'] = max(report['coefficients'],float(np.abs(a-b).max()/max(np.abs(a).max(),1e-12)))
+    report['reconstruction'] = float(np.abs(candidate.inv(candidate.fwd(image))-image).max())
+    report['pyct_reconstruction'] = float(np.abs(reference.inv(reference.fwd(image))-image).max())
+    return report
+
+@functools.lru_cache(maxsize=None)
+def layout_matches_pyct(n=(72,56),nbs=3,nba=8,ac=True):
+    report = compare_with_pyct(n,nbs,nba,ac)
+    return report is None or (report['scales'] and report['wedges'] and report['shapes'])
@@ -1,6 +1,29 @@
 from PyQt5 import QtCore, QtGui, QtWidgets
+import functools
+import matplotlib.pyplot as plt
 import numpy as np
 
+@functools.lru_cache(maxsize=16)
+def wedge_geometry(nbs,nba):
+    a = 800/2**nbs
+    counts = [1]+[nba*2**(i//2) for i in range(1,nbs)]
+    scales = np.repeat(np.arange(nbs),counts)
+    angles = np.concatenate([np.arange(m) for m in counts])
+    m = -np.take(counts,scales).astype(np.float64)
+    inner = a*2.0**(scales-1)
+    outer = a*2.0**scales
+    theta = np.stack([angles,angles,angles+1,angles+1],axis=1)*(2*np.pi)/m[:,None]
+    radius = np.stack([inner,outer,outer,inner],axis=1)
+    tangent = np.tan(theta)
+    with np.errstate(divide='ignore'):
+        x = np.minimum(radius,np.abs(radius/tangent))*np.sign(np.cos(theta))
+    y = np.minimum(radius,np.abs(radius*tangent))*np.sign(np.sin(theta))
+    polygons = np.stack([x,y],axis=2)
+    polygons[0] = [[-a,-a],[a,-a],[a,a],[-a,a]]
+    for array in (scales,angles,polygons):
+        array.flags.writeable = False
+    return scales, angles, polygons
+
 class DigTile(QtWidgets.QGraphicsView):
     WEDGE_REQUESTED = QtCore.pyqtSignal(int,int,bool)
     WEDGE_ENTER = QtCore.pyqtSignal(int,int)
@@ -22,8 +45,7 @@ class DigTile(QtWidgets.QGraphicsView):
         self.setFrameShape(QtWidgets.QFrame.NoFrame)
 
     def initialize_tiles(self,nbs,nba,ac,cursor,click):
-        for item in self.my_scene.items():
-            self.my_scene.removeItem(item)
+        self.my_scene.clear()
         self._mouseIsPressed = False
         self._mouseIsMoved = False
         self.max_zoom_factor = 20
@@ -31,7 +53,6 @@ class DigTile(QtWidgets.QGraphicsView):
         self._empty = False
         self.cursor_selection = cursor
         self.click_function = click
-        self.wedges = {}
         self.chosen_wedge_indices = set()
         self.edited_wedges_indices = set()
         self._a = 800/2**nbs
@@ -40,7 +61,7 @@ class DigTile(QtWidgets.QGraphicsView):
         self.nba = nba
         self.ac = ac
         self._photo = QtWidgets.QGraphicsPixmapItem()
-        self._background = QtGui.QPixmap(self._tiles_size,self._tiles_size)
+        self._background = QtGui.QPixmap(int(self._tiles_size),int(self._tiles_size))
         self._background.fill(QtGui.QColor("white"))
         self._photo.setPixmap(self._background)
         self._item_group = QtWidgets.QGraphicsItemGroup()
@@ -55,11 +76,19 @@ class DigTile(QtWidgets.QGraphicsView):
         self.my_scene.addItem(self._item_group)
         self.my_scene.addItem(self._photo)
         self._is_initialized = True
-        for i in range(nbs):
-            m = 1 if i == 0 else self.nba * 2**(i//2)
-            available = False if not self.ac and i == nbs-1 else True
-            for j in range(m):
-                self.add_wedge(i,j,available)
+        self.wedges = wedge_layer(nbs,nba,ac,self._tiles_size,QtGui.QPen(QtCore.Qt.black,2))
+        self.wedges.MOUSE_EVENT.connect(self.wedge_event_manager)
+        self.my_scene.addItem(self.wedges)
+
+    def set_heatmap(self,scales,angles,values,colormap='viridis'):
+        if values is None:
+            self.wedges.set_heatmap(None)
+            return
+        lut = np.uint32(np.round(plt.get_cmap(colormap)(np.linspace(0,1,256))[:,:3]*255))
+        lut = (lut[:,0] << 16) | (lut[:,1] << 8) | lut[:,2]
+        colors = np.empty(len(self.wedges.status),dtype=np.uint32)
+        colors[self.wedges.index(np.asarray(scales),np.asarray(angles))] = lut[np.clip(np.asarray(values)*255,0,255).astype(np.intp)]
+        self.wedges.set_heatmap(colors)
 
     def show_selected_cells(self):
         if self._is_initialized:
@@ -146,162 +175,153 @@ class DigTile(QtWidgets.QGraphicsView):
         painter.end()
         capture.save(imageFileName[0])
 
-    def add_wedge(self,i,j,available):
-        a = self._a
-        if i == 0:
-            x1, y1, x2, y2, x3, y3, x4, y4 = -a, -a, a, -a, a, a, -a, a
-        else:
-            m = -self.nba * 2**(i//2)
-            x1 = min(2**(i-1)*a, abs(2**(i-1)*a/np.tan(np.pi*2*j/m)))*np.sign(np.cos(np.pi*2*j/m))
-            y1 = min(2**(i-1)*a, abs(2**(i-1)*a*np.tan(np.pi*2*j/m)))*np.sign(np.sin(np.pi*2*j/m))
-            x2 = min(2**i*a, abs(2**i*a/np.tan(np.pi*2*j/m)))*np.sign(np.cos(np.pi*2*j/m))
-            y2 = min(2**i*a, abs(2**i*a*np.tan(np.pi*2*j/m)))*np.sign(np.sin(np.pi*2*j/m))
-            x3 = min(2**i*a, abs(2**i*a/np.tan(np.pi*2*(j+1)/m)))*np.sign(np.cos(np.pi*2*(j+1)/m))
-            y3 = min(2**i*a, abs(2**i*a*np.tan(np.pi*2*(j+1)/m)))*np.sign(np.sin(np.pi*2*(j+1)/m))
-            x4 = min(2**(i-1)*a, abs(2**(i-1)*a/np.tan(np.pi*2*(j+1)/m)))*np.sign(np.cos(np.pi*2*(j+1)/m))
-            y4 = min(2**(i-1)*a, abs(2**(i-1)*a*np.tan(np.pi*2*(j+1)/m)))*np.sign(np.sin(np.pi*2*(j+1)/m))
-        wedge = QtGui.QPolygonF([QtCore.QPointF(x1 + self._tiles_size/2,y1 + self._tiles_size/2),\
-            QtCore.QPointF(x2 + self._tiles_size/2,y2 + self._tiles_size/2),\
-            QtCore.QPointF(x3 + self._tiles_size/2,y3 + self._tiles_size/2),\
-            QtCore.QPointF(x4 + self._tiles_size/2,y4 + self._tiles_size/2)])
-        wedge_object = self.my_scene.addPolygon(i,j,wedge,QtGui.QPen(QtCore.Qt.black,2))
-        wedge_object.MOUSE_EVENT.connect(self.wedge_event_manager)
-        if not available:
-            wedge_object.setStatus('unavailable')
-        self.wedges[(i,j)] = wedge_object
-
     def wedge_event_manager(self,i,j,event):
         if self.cursor_selection == 'cell':
-            if event == 'enter':
-                self.wedges[(i,j)].setStatus('hover')
-                self.WEDGE_ENTER.emit(i,j)
-            elif event == 'leave':
-                self.wedges[(i,j)].setStatus('leave')
-            elif event == 'press':
-                if self.click_function == 'show':
+            selection = self.wedges.index(i,j)
+        elif self.cursor_selection == 'level':
+            selection = self.wedges.scale_slice(i)
+        else:
+            return
+        if event == 'enter':
+            self.wedges.set_flag(selection,wedge_layer.HOVER,True)
+            self.WEDGE_ENTER.emit(i,j)
+        elif event == 'leave':
+            self.wedges.set_flag(selection,wedge_layer.HOVER,False)
+        elif event == 'press':
+            angles = np.atleast_1d(self.wedges.angles[selection]).tolist()
+            if self.click_function == 'show':
+                for j in angles:
                     self.WEDGE_REQUESTED.emit(i,j,True)
-                elif self.click_function == 'select':
-                    chosen = self.wedges[(i,j)].setStatus('chosen')
-                    if chosen:
+            elif self.click_function == 'select':
+                chosen = np.atleast_1d(self.wedges.toggle(selection,wedge_layer.CHOSEN)).tolist()
+                for j,state in zip(angles,chosen):
+                    if state:
                         self.chosen_wedge_indices.add((i,j))
                     else:
-                        self.chosen_wedge_indices.remove((i,j))
-                    self.WEDGE_CHOSEN.emit(True if self.chosen_wedge_indices else False)
-        elif self.cursor_selection == 'level':
-            m = 1 if i == 0 else self.nba * 2**(i//2)
-            if event == 'enter':
-                for j in range(m):
-                    self.wedges[(i,j)].setStatus('hover')
-                self.WEDGE_ENTER.emit(i,j)
-            elif event == 'leave':
-                for j in range(m):
-                    self.wedges[(i,j)].setStatus('leave')
-            elif event == 'press':
-                if self.click_function == 'show':
-                    for j in range(m):
-                        self.WEDGE_REQUESTED.emit(i,j,True)
-                elif self.click_function == 'select':
-                    for j in range(m):
-                        chosen = self.wedges[(i,j)].setStatus('chosen')
-                        if chosen:
-                            self.chosen_wedge_indices.add((i,j))
-                        else:
-                            self.chosen_wedge_indices.remove((i,j))
-                    self.WEDGE_CHOSEN.emit(True if self.chosen_wedge_indices else False)
+                        self.chosen_wedge_indices.discard((i,j))
+                self.WEDGE_CHOSEN.emit(True if self.chosen_wedge_indices else False)
 
 class my_scene(QtWidgets.QGraphicsScene):
     def __init__(self,parent=None):
         super(my_scene,self).__init__(parent)
 
-    def addPolygon(self, i,j, polygon, pen):
-        super(my_scene,self).addPolygon(polygon,pen)
-        wedge_object = my_wedge(i,j,polygon)
-        self.addItem(wedge_object)
-        return wedge_object
-
-class my_wedge(QtWidgets.QGraphicsObject, QtWidgets.QGraphicsPolygonItem):
+class wedge_layer(QtWidgets.QGraphicsObject):
 
     MOUSE_EVENT = QtCore.pyqtSignal(int, int, str)
+    HOVER, CHOSEN, EDITED, UNAVAILABLE = 1, 2, 4, 8
 
-    def __init__(self,i,j,polygon,parent=None):
-        super(my_wedge,self).__init__()
-        self.item = QtWidgets.QGraphicsPolygonItem(polygon,parent)
-        self.i, self.j = i,j
+    def __init__(self,nbs,nba,ac,size,pen,parent=None):
+        super(wedge_layer,self).__init__(parent)
+        self.nbs, self.nba = nbs, nba
+        self.scales, self.angles, polygons = wedge_geometry(nbs,nba)
+        self.offsets = np.concatenate([[0],np.cumsum(np.bincount(self.scales))])
+        self._a = 800/2**nbs
+        self._size = size
+        polygons = polygons+size/2
+        self.bounds = np.concatenate([polygons.min(axis=1),polygons.max(axis=1)],axis=1)
+        self.polygons = [QtGui.QPolygonF([QtCore.QPointF(x,y) for x,y in corners]) for corners in polygons.tolist()]
+        self.status = np.zeros(len(self.scales),dtype=np.uint8)
+        if not ac:
+            self.status[self.scale_slice(nbs-1)] |= self.UNAVAILABLE
+        self.pen = pen
+        self.brushes = [self.brush(code) for code in range(16)]
+        self.heatmap = None
+        self.current = None
         self.setAcceptHoverEvents(True)
-        self._status_chosen = False
-        self._status_edited = False
-        self._available = True
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption,True)
+
+    def brush(self,code):
+        hover = code & self.HOVER
+        if code & self.UNAVAILABLE:
+            return QtGui.QBrush(QtGui.QColor('lightGray'),QtCore.Qt.BDiagPattern)
+        elif code & self.CHOSEN:
+            return QtGui.QBrush(QtGui.QColor('darkGreen' if hover else 'green'),QtCore.Qt.SolidPattern)
+        elif code & self.EDITED:
+            return QtGui.QBrush(QtGui.QColor('darkRed' if hover else 'red'),QtCore.Qt.SolidPattern)
+        elif hover:
+            return QtGui.QBrush(QtGui.QColor('lightGray'),QtCore.Qt.SolidPattern)
+        return QtGui.QBrush()
 
-    def shape(self):
-        return self.item.shape()
+    def set_heatmap(self,colors):
+        self.heatmap = None if colors is None else [QtGui.QBrush(QtGui.QColor(rgb)) for rgb in colors.tolist()]
+        self.update()
+
+    def index(self,i,j):
+        return self.offsets[i]+j
+
+    def scale_slice(self,i):
+        return slice(self.offsets[i],self.offsets[i+1])
+
+    def locate(self,pos):
+        x, y = pos.x()-self._size/2, pos.y()-self._size/2
+        radius = max(abs(x),abs(y))/self._a
+        if radius <= 1:
+            i, j = 0, 0
+        else:
+            i = int(np.ceil(np.log2(radius)))
+            if i >= self.nbs:
+                return None
+            m = self.nba*2**(i//2)
+            j = int((-np.arctan2(y,x))%(2*np.pi)*m/(2*np.pi))%m
+        if self.status[self.index(i,j)] & self.UNAVAILABLE:
+            return None
+        return i, j
+
+    def set_flag(self,selection,flag,value):
+        if value:
+            self.status[selection] |= flag
+        else:
+            self.status[selection] &= ~np.uint8(flag)
+        self.refresh(selection)
+
+    def toggle(self,selection,flag):
+        self.status[selection] ^= flag
+        self.refresh(selection)
+        return self.status[selection] & flag != 0
+
+    def refresh(self,selection):
+        bounds = self.bounds[selection].reshape(-1,4)
+        width = self.pen.widthF()
+        self.update(QtCore.QRectF(QtCore.QPointF(bounds[:,0].min()-width,bounds[:,1].min()-width),\
+            QtCore.QPointF(bounds[:,2].max()+width,bounds[:,3].max()+width)))
 
     def boundingRect(self):
-        return self.item.boundingRect()
+        return QtCore.QRectF(0,0,self._size,self._size)
 
     def paint(self,painter,option,widget):
-        QtWidgets.QGraphicsPolygonItem.paint(self.item,painter,option,widget)
+        rect = option.exposedRect
+        visible = np.flatnonzero((self.bounds[:,2] >= rect.left()) & (self.bounds[:,0] <= rect.right()) &\
+            (self.bounds[:,3] >= rect.top()) & (self.bounds[:,1] <= rect.bottom()))
+        codes = self.status[visible]
+        painter.setPen(self.pen)
+        for code in np.unique(codes).tolist():
+            if code == 0 and self.heatmap is not None:
+                for k in visible[codes == code].tolist():
+                    painter.setBrush(self.heatmap[k])
+                    painter.drawPolygon(self.polygons[k])
+                continue
+            painter.setBrush(self.brushes[code])
+            for k in visible[codes == code].tolist():
+                painter.drawPolygon(self.polygons[k])
 
     def hoverEnterEvent(self,event):
-        if self._available:
-            self.MOUSE_EVENT.emit(self.i, self.j,'enter')
+        self.hoverMoveEvent(event)
+
+    def hoverMoveEvent(self,event):
+        wedge = self.locate(event.pos())
+        if wedge != self.current:
+            if self.current is not None:
+                self.MOUSE_EVENT.emit(self.current[0],self.current[1],'leave')
+            self.current = wedge
+            if wedge is not None:
+                self.MOUSE_EVENT.emit(wedge[0],wedge[1],'enter')
 
     def hoverLeaveEvent(self,event):
-        if self._available:
-            self.MOUSE_EVENT.emit(self.i, self.j,'leave')
+        if self.current is not None:
+            self.MOUSE_EVENT.emit(self.current[0],self.current[1],'leave')
+            self.current = None
 
     def mousePressEvent(self,event):
-        if self._available:
-            self.MOUSE_EVENT.emit(self.i, self.j,'press')
-
-    def setStatus(self,status):
-        if status == 'hover' and not self._status_chosen and not self._status_edited:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('lightGray'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'hover' and self._status_chosen and not self._status_edited:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('darkGreen'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'hover' and not self._status_chosen and self._status_edited:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('darkRed'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'chosen' and self._status_chosen == False:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('green'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-            self._status_chosen = True
-            return self._status_chosen
-        elif status == 'chosen' and self._status_chosen == True:
-            self.item.setBrush(QtGui.QBrush())
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-            self._status_chosen = False
-            return self._status_chosen
-        elif status == 'edited':
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('red'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-            self._status_edited = True
-        elif status == 'relase':
-            self._status_chosen = False
-            self.item.setBrush(QtGui.QBrush())
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'leave' and not self._status_chosen and not self._status_edited:
-            self.item.setBrush(QtGui.QBrush())
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'leave' and self._status_chosen and not self._status_edited:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('green'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'leave' and not self._status_chosen and self._status_edited:
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('red'),QtCore.Qt.SolidPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-        elif status == 'unavailable':
-            self.item.setBrush(QtGui.QBrush(QtGui.QColor('lightGray'),QtCore.Qt.BDiagPattern))
-            self.item.update(self.item.boundingRect())
-            self.update(self.boundingRect())
-            self._available = False
\ No newline at end of file
+        wedge = self.locate(event.pos())
+        if wedge is not None:
+            self.MOUSE_EVENT.emit(wedge[0],wedge[1],'press')
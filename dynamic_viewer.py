@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+import matplotlib.ticker as ticker
 from PyQt5 import QtCore, QtWidgets, QtGui
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
@@ -29,10 +30,11 @@ class DynamicViewer(QtWidgets.QWidget):
 
     UPDATE_LOG = QtCore.pyqtSignal(str)
 
-    def __init__(self,image,fontname,fontsize,colormap,log_scale=True, pos=111, kwargs={}):
+    def __init__(self,image,fontname,fontsize,colormap,log_scale=True, pos=111, kwargs={}, render_mode='raster'):
         super(DynamicViewer,self).__init__()
         self.pos = pos
-        self.figure = MplCanvas(self,pos=self.pos)
+        self.render_mode = render_mode
+        self.figure = MplCanvas(self,pos=self.pos,dpi=100 if self.render_mode == 'raster' else 400)
         self.image = image
         self.log_scale = log_scale
         self.fontname = fontname
@@ -48,8 +50,12 @@ class DynamicViewer(QtWidgets.QWidget):
         self.setMaximumWidth(1600)
         if self.kwargs.get('save_as_file', False):
             pass
-        self.original_min = np.amin(np.amin(image))
-        self.original_max = np.amin(np.amax(image))
+        self.statistics = self.kwargs.get('statistics')
+        if self.statistics is not None:
+            self.original_min, self.original_max = self.statistics['minimum'], self.statistics['maximum']
+        else:
+            self.original_min = np.amin(np.amin(image))
+            self.original_max = np.amin(np.amax(image))
         self.show_plot()
 
     def show_plot(self):
@@ -74,7 +80,7 @@ class DynamicViewer(QtWidgets.QWidget):
             self.cbar.ax.set_ylabel("Intensity",font_dict)
         self.cbar.ax.tick_params(width = 0.1, length = 1, labelsize=self.fontsize)
         self.cbar.outline.set_linewidth(0.1)
-        self.figure.draw()
+        self.figure.draw_idle()
 
     def refresh_font_name(self,fontname):
         self.fontname = fontname
@@ -93,20 +99,59 @@ class DynamicViewer(QtWidgets.QWidget):
             self.cbar.ax.set_ylabel("Intensity",font_dict)
         self.cbar.ax.tick_params(width = 0.1, length = 1, labelsize=self.fontsize)
         self.cbar.outline.set_linewidth(0.1)
-        self.figure.draw()
+        self.figure.draw_idle()
 
     def replot(self,image,colormap):
+        if self.render_mode == 'raster':
+            self.rasterplot(image,colormap)
+        else:
+            self.contourplot(image,colormap)
+
+    def log_range(self,image):
+        if self.statistics is not None:
+            int_max, int_min = self.statistics['maximum']*self.previous_gain, self.statistics['minimum']*self.previous_gain
+        else:
+            int_max, int_min = np.amax(np.amax(image)), np.amin(np.amin(image))
+        self.log_max = int(np.log10(int_max))
+        if int_min <= 0:
+            self.log_min = self.minimum_log_intensity
+        else:
+            self.log_min = max(int(np.log10(int_min)),self.minimum_log_intensity)
+
+    def rasterplot(self,image,colormap):
+        self.colormap = colormap
+        if self.log_scale:
+            self.log_range(image)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                data = np.clip(np.log10(image.T),self.log_min,self.log_max)
+            vmin,vmax = self.log_min,self.log_max
+        else:
+            data = image.T
+            vmin,vmax = self.original_min,self.original_max
+        if not hasattr(self,'raster'):
+            self.figure.clear()
+            self.raster = self.figure.axes.imshow(data,cmap=self.colormap,vmin=vmin,vmax=vmax,origin='upper',\
+                interpolation='nearest',extent=(-0.5,len(image)-0.5,len(image[0])-0.5,-0.5))
+            self.cbar = self.figure.fig.colorbar(self.raster,format='%3.1f')
+            self.refresh_font_name(self.fontname)
+            self.refresh_font_size(self.fontsize)
+            return
+        self.raster.set_data(data)
+        self.raster.set_cmap(self.colormap)
+        self.raster.set_clim(vmin,vmax)
+        if not self.log_scale:
+            self.cbar.locator = ticker.AutoLocator()
+            self.cbar.formatter = ticker.FormatStrFormatter('%3.1f')
+            self.cbar.update_ticks()
+        self.refresh_font_size(self.fontsize)
+
+    def contourplot(self,image,colormap):
         self.colormap = colormap
         self.figure.clear()
         self.figure.axes.invert_yaxis()
         self.x_linear,self.y_linear = np.meshgrid(np.linspace(0,len(image)-1,len(image)), np.linspace(0,len(image[0])-1,len(image[0])))
         if self.log_scale:
-            self.log_max = int(np.log10(np.amax(np.amax(image))))
-            int_min = np.amin(np.amin(image))
-            if int_min <= 0:
-                self.log_min = self.minimum_log_intensity
-            else:
-                self.log_min = max(int(np.log10(int_min)),self.minimum_log_intensity)
+            self.log_range(image)
             self.cs = self.figure.axes.contourf(self.x_linear,self.y_linear,np.clip(np.log10(image.T),self.log_min,self.log_max),1000,cmap=self.colormap,origin='upper')
         else:
             self.cs = self.figure.axes.contourf(self.x_linear,self.y_linear,image.T,1000, vmin=self.original_min, vmax=self.original_max, cmap=self.colormap,origin='upper')
@@ -131,15 +176,19 @@ class DynamicViewer(QtWidgets.QWidget):
         elif unit == 'dB':
             factor = 10**(float(gain)/20)
         if factor > 0:
-            self.image *= factor/self.previous_gain
-            self.replot(self.image,self.colormap)
+            self.image = self.image*(factor/self.previous_gain)
             self.previous_gain = factor
+            self.replot(self.image,self.colormap)
         else:
             self.UPDATE_LOG.emit('[ERROR] Invalid gain value!')
 
     def refresh_colormap(self,colormap):
         self.colormap = colormap
-        self.replot(self.image,self.colormap)
+        if self.render_mode == 'raster' and hasattr(self,'raster'):
+            self.raster.set_cmap(self.colormap)
+            self.figure.draw_idle()
+        else:
+            self.replot(self.image,self.colormap)
 
     def refresh_scale(self,state):
         if not self.log_scale and state == 2:
@@ -197,10 +246,16 @@ class CurveletControl(QtWidgets.QWidget):
         self.colormap.setCurrentText('bwr')
         self.logScaleLabel = QtWidgets.QLabel("Log scale")
         self.logScale = QtWidgets.QCheckBox()
+        self.renderModeLabel = QtWidgets.QLabel("Renderer (new tabs)")
+        self.renderMode = QtWidgets.QComboBox()
+        self.renderMode.addItem('raster')
+        self.renderMode.addItem('contour')
         self.plotOptionsGrid.addWidget(self.colormapLabel,0,0)
         self.plotOptionsGrid.addWidget(self.colormap,0,1)
         self.plotOptionsGrid.addWidget(self.logScaleLabel,1,0)
         self.plotOptionsGrid.addWidget(self.logScale,1,1)
+        self.plotOptionsGrid.addWidget(self.renderModeLabel,2,0)
+        self.plotOptionsGrid.addWidget(self.renderMode,2,1)
         self.plotOptionsGrid.setAlignment(QtCore.Qt.AlignTop)
 
         self.mainTab = QtWidgets.QTabWidget()
@@ -217,10 +272,11 @@ class CurveletControl(QtWidgets.QWidget):
         self.grid.addWidget(self.plotOptions,1,1,1,1)
         self.grid.addWidget(self.mainTab,0,0,2,1)
 
-    def add_wedge(self,structure,i,j):
+    def add_wedge(self,structure,i,j,statistics=None):
         self.mainTab.disconnect()
         viewer = DynamicViewer(structure[i][j],self.fontList.currentFont().family(),\
-            self.fontSizeSlider.value(),self.colormap.currentText(),self.logScale.isChecked())
+            self.fontSizeSlider.value(),self.colormap.currentText(),self.logScale.isChecked(),\
+            kwargs={'statistics':statistics},render_mode=self.renderMode.currentText())
         viewer.UPDATE_LOG.connect(self.UPDATE_LOG)
         index = self.mainTab.addTab(viewer,'({},{})'.format(i,j))
         self.current_wedge_index = (i,j)
@@ -2,11 +2,10 @@ import copy
 import process
 import browser
 import digital_tile
+import dynamic_viewer
 import canvas
-import pyct
+import curvelet
 import configparser
-import PIL.Image as pilImage
-import PIL.ImageChops as pilChops
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -23,6 +22,13 @@ class Window(QtWidgets.QMainWindow):
 		self.current_status = {}
 		self.canvas_config = configparser.ConfigParser()
 		self.canvas_config.read('./configuration.ini')
+		self.transform_cache = process.TransformCache(self.canvas_config)
+		process.plan_cache.resize(int(self.canvas_config['cacheDefault']['planentries']),\
+			int(float(self.canvas_config['cacheDefault']['planmemorymb'])*2**20))
+		process.wedge_executor.resize(int(self.canvas_config['parallelDefault']['workers']) or None,\
+			int(self.canvas_config['parallelDefault']['chunkcoefficients']))
+		self.profiler = process.StageProfiler(self.canvas_config['profileDefault'].getboolean('tracemalloc'))
+		self.profiler.UPDATE_LOG.connect(self.update_log)
 		self.mainSplitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
 		self.topSplitter = QtWidgets.QSplitter(QtCore.Qt.Horizontal)
 		self.canvasFrame = QtWidgets.QWidget()
@@ -65,6 +71,12 @@ class Window(QtWidgets.QMainWindow):
 		self.ac = QtWidgets.QCheckBox()
 		self.ac.setChecked(True)
 		self.ac.stateChanged.connect(self.ac_changed)
+		self.backend_label = QtWidgets.QLabel('Transform backend:')
+		self.backend = QtWidgets.QComboBox()
+		for backend in curvelet.available_backends():
+			self.backend.addItem(backend)
+		self.backend.setCurrentText(curvelet.default_backend(self.canvas_config['transformDefault']['backend']))
+		self.backend.currentTextChanged.connect(self.backend_changed)
 		self.wedge_index_label = QtWidgets.QLabel('Current wedge index:')
 
 		self.threshold_label = QtWidgets.QLabel('Threshold ({})'.format(30))
@@ -73,6 +85,22 @@ class Window(QtWidgets.QMainWindow):
 		self.threshold_slider.setMaximum(255)
 		self.threshold_slider.setValue(30)
 		self.threshold_slider.valueChanged.connect(self.threshold_changed)
+		self.threshold_mode_label = QtWidgets.QLabel('Threshold mode:')
+		self.threshold_mode = QtWidgets.QComboBox()
+		for mode in process.ThresholdEngine.MODES:
+			self.threshold_mode.addItem(mode)
+		self.threshold_mode.currentTextChanged.connect(self.threshold_changed)
+		self.live_preview_label = QtWidgets.QLabel('Live threshold preview:')
+		self.live_preview = QtWidgets.QCheckBox()
+		self.live_preview.setChecked(False)
+		self.live_preview.stateChanged.connect(self.live_preview_changed)
+		self.preview_timer = QtCore.QTimer(self)
+		self.preview_timer.setSingleShot(True)
+		self.preview_timer.setInterval(150)
+		self.preview_timer.timeout.connect(self.request_preview)
+		self.sweep_figure = dynamic_viewer.MplCanvas(self,width=4,height=1.6,dpi=100)
+		self.sweep_figure.setMinimumHeight(160)
+		self.sweep_figure.setVisible(False)
 
 
 		self.cursor_selections_label = QtWidgets.QLabel('Cursor selection rule:')
@@ -85,6 +113,12 @@ class Window(QtWidgets.QMainWindow):
 		self.click_functions.addItem('select')
 		self.click_functions.addItem('show')
 		self.click_functions.currentTextChanged.connect(self.digital_tile.set_click_function_rule)
+		self.tile_coloring_label = QtWidgets.QLabel('Tile coloring:')
+		self.tile_coloring = QtWidgets.QComboBox()
+		self.tile_coloring.addItem('state')
+		for mode in process.CurveletStructure.HEATMAPS:
+			self.tile_coloring.addItem(mode)
+		self.tile_coloring.currentTextChanged.connect(self.update_heatmap)
 		self.previous_difference_scale_factor = 10
 		self.difference_scale_factor_label = QtWidgets.QLabel('Difference gain ({})'.format(self.previous_difference_scale_factor))
 		self.difference_scale_factor_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
@@ -92,6 +126,12 @@ class Window(QtWidgets.QMainWindow):
 		self.difference_scale_factor_slider.setMaximum(100)
 		self.difference_scale_factor_slider.setValue(self.previous_difference_scale_factor)
 		self.difference_scale_factor_slider.valueChanged.connect(self.difference_scale_factor_changed)
+		self.difference_mode_label = QtWidgets.QLabel('Difference mode:')
+		self.difference_mode = QtWidgets.QComboBox()
+		for mode in process.DifferenceImage.MODES:
+			self.difference_mode.addItem(mode)
+		self.difference_mode.currentTextChanged.connect(self.difference_scale_factor_changed)
+		self.difference_image = process.DifferenceImage()
 
 		self.button_group = QtWidgets.QGroupBox()
 		self.button_group_grid = QtWidgets.QVBoxLayout(self.button_group)
@@ -110,17 +150,26 @@ class Window(QtWidgets.QMainWindow):
 		self.apply_threshold_button = QtWidgets.QPushButton('Apply Threshold Denoise')
 		self.apply_threshold_button.clicked.connect(self.threshold_denoise)
 		self.apply_threshold_button.setEnabled(False)
+		self.threshold_sweep_button = QtWidgets.QPushButton('Threshold Sweep')
+		self.threshold_sweep_button.clicked.connect(self.threshold_sweep)
+		self.threshold_sweep_button.setEnabled(False)
+		self.export_timings_button = QtWidgets.QPushButton('Export Stage Timings')
+		self.export_timings_button.clicked.connect(self.export_timings)
 		self.button_group_grid.addWidget(self.show_selected_cells_button)
 		self.button_group_grid.addWidget(self.close_all_button)
 		self.button_group_grid.addWidget(self.load_curvelet_button)
 		self.button_group_grid.addWidget(self.show_modified_image_button)
 		self.button_group_grid.addWidget(self.apply_threshold_button)
+		self.button_group_grid.addWidget(self.threshold_sweep_button)
+		self.button_group_grid.addWidget(self.export_timings_button)
 		self.button_group_grid.setAlignment(QtCore.Qt.AlignTop)
 
 		self.controlPanelGrid.setAlignment(QtCore.Qt.AlignTop)
 		self.controlPanelGrid.addWidget(self.open_label,0,0,1,6)
 		self.controlPanelGrid.addWidget(self.open_button,1,0,1,6)
 		self.controlPanelGrid.addWidget(self.browser_widget,2,0,1,6)
+		self.controlPanelGrid.addWidget(self.backend_label,9,0,1,2)
+		self.controlPanelGrid.addWidget(self.backend,9,2,1,4)
 		self.controlPanelGrid.addWidget(self.nbs_label,10,0,1,2)
 		self.controlPanelGrid.addWidget(self.nbs,10,2,1,4)
 		self.controlPanelGrid.addWidget(self.nba_label,11,0,1,2)
@@ -131,11 +180,20 @@ class Window(QtWidgets.QMainWindow):
 		self.controlPanelGrid.addWidget(self.threshold_slider,13,2,1,4)
 		self.controlPanelGrid.addWidget(self.difference_scale_factor_label,14,0,1,2)
 		self.controlPanelGrid.addWidget(self.difference_scale_factor_slider,14,2,1,4)
+		self.controlPanelGrid.addWidget(self.difference_mode_label,15,0,1,2)
+		self.controlPanelGrid.addWidget(self.difference_mode,15,2,1,4)
+		self.controlPanelGrid.addWidget(self.threshold_mode_label,16,0,1,2)
+		self.controlPanelGrid.addWidget(self.threshold_mode,16,2,1,4)
+		self.controlPanelGrid.addWidget(self.live_preview_label,17,0,1,2)
+		self.controlPanelGrid.addWidget(self.live_preview,17,2,1,4)
+		self.controlPanelGrid.addWidget(self.sweep_figure,18,0,1,6)
 		self.controlPanelGrid.addWidget(self.cursor_selections_label,20,0,1,2)
 		self.controlPanelGrid.addWidget(self.cursor_selections,20,2,1,4)
 		self.controlPanelGrid.addWidget(self.click_functions_label,21,0,1,2)
 		self.controlPanelGrid.addWidget(self.click_functions,21,2,1,4)
-		self.controlPanelGrid.addWidget(self.wedge_index_label,22,0,1,6)
+		self.controlPanelGrid.addWidget(self.tile_coloring_label,22,0,1,2)
+		self.controlPanelGrid.addWidget(self.tile_coloring,22,2,1,4)
+		self.controlPanelGrid.addWidget(self.wedge_index_label,23,0,1,6)
 		self.controlPanelGrid.addWidget(self.digital_tile,30,0,1,5)
 		self.controlPanelGrid.addWidget(self.button_group,30,5,1,1)
 
@@ -205,7 +263,23 @@ class Window(QtWidgets.QMainWindow):
 	        return ''
 
 	def update_wedge_index(self,i,j):
-		self.wedge_index_label.setText('Current wedge index: ({},{})'.format(i,j))
+		if hasattr(self,'curvelet_structure'):
+			statistics = self.curvelet_structure.statistics.get(i,j)
+			self.wedge_index_label.setText('Current wedge index: ({},{})  energy {:.3g}, max|c| {:.3g}, noise {:.3g}'.format(i,j,\
+				statistics['energy'],statistics['max_abs'],statistics['noise']))
+		else:
+			self.wedge_index_label.setText('Current wedge index: ({},{})'.format(i,j))
+
+	def update_heatmap(self):
+		if not hasattr(self,'curvelet_structure'):
+			return
+		mode = self.tile_coloring.currentText()
+		if mode == 'state':
+			self.digital_tile.set_heatmap(None,None,None)
+			return
+		threshold, wedges, _ = self.current_status.get('threshold_denoise',(None,None,None))
+		scales, angles = zip(*self.curvelet_structure.engine.layout.wedges)
+		self.digital_tile.set_heatmap(scales,angles,self.curvelet_structure.heatmap(mode,threshold,wedges))
 
 	def update_chosen_wedges(self,state):
 		self.show_selected_cells_button.setEnabled(state)
@@ -215,6 +289,8 @@ class Window(QtWidgets.QMainWindow):
 			self.apply_threshold_button.setEnabled(True)
 		else:
 			self.apply_threshold_button.setEnabled(False)
+		if self.live_preview.isChecked() and hasattr(self,'curvelet_structure'):
+			self.preview_timer.start()
 
 	def browse_image(self):
 		path = self.get_img_path()
@@ -223,9 +299,14 @@ class Window(QtWidgets.QMainWindow):
 
 	def open_image(self,path):
 		self.open_label.setText('The image file path is:\n'+path)
-		self.img_array = self.image_worker.get_image(16,path,False,20,50,self.image_crop)
-		self.image = self.image_worker.nparray2pilImg(self.img_array)
-		self.canvas.set_photo(self.image_worker.nparray2qPixImg(self.img_array))
+		self.image_path = path
+		self.image_is_preview = os.path.splitext(path)[1] in self.image_worker.supportedRawFormats
+		with self.profiler.stage('decode'):
+			self.img_array = self.image_worker.get_image(16,path,False,20,50,self.image_crop,preview=self.image_is_preview)
+			self.image = self.image_worker.nparray2pilImg(self.img_array)
+		with self.profiler.stage('qpixmap'):
+			pixmap = self.image_worker.nparray2qPixImg(self.img_array)
+		self.canvas.set_photo(pixmap)
 		self.canvas.fit_canvas()
 		if hasattr(self,'canvas_modified'):
 			self.canvasFrameGrid.removeWidget(self.canvas_modified)
@@ -253,7 +334,8 @@ class Window(QtWidgets.QMainWindow):
 			self.close_all_button.setEnabled(True)
 
 	def click_show_wedge(self,i,j,interactive):
-		self.curvelet_structure.show_wedge(i,j,interactive)
+		with self.profiler.stage('wedge plot'):
+			self.curvelet_structure.show_wedge(i,j,interactive)
 		self.close_all_button.setEnabled(True)
 
 	def nbs_changed(self,text):
@@ -274,94 +356,215 @@ class Window(QtWidgets.QMainWindow):
 		else:
 			self.load_curvelet_button.setEnabled(False)
 
+	def backend_changed(self,text):
+		if self.backend.currentText() != self.current_status.get('curvelet_transform',(None,)*4)[3]:
+			self.load_curvelet_button.setEnabled(True)
+		else:
+			self.load_curvelet_button.setEnabled(False)
+
+	def load_full_image(self):
+		with self.profiler.stage('decode'):
+			self.img_array = self.image_worker.get_image(16,self.image_path,False,20,50,self.image_crop)
+			self.image = self.image_worker.nparray2pilImg(self.img_array)
+		with self.profiler.stage('qpixmap'):
+			pixmap = self.image_worker.nparray2qPixImg(self.img_array)
+		self.canvas.set_photo(pixmap)
+		self.canvas.fit_canvas()
+		self.image_is_preview = False
+		self.update_log('[SUCCESS] Full quality image decoded!')
+
 	def load_curvelet_transform(self):
 		if hasattr(self,'image'):
-			self.fdct_worker = pyct.fdct2(n=self.image.size,nbs=int(self.nbs.currentText()),\
-				nba=int(self.nba.currentText()),ac=self.ac.isChecked(),norm=False,vec=True)
+			if self.image_is_preview:
+				self.load_full_image()
+			self.plan = process.plan_cache.get(self.image.size,int(self.nbs.currentText()),\
+				int(self.nba.currentText()),self.ac.isChecked(),self.backend.currentText())
+			self.fdct_worker = self.plan.fdct
 			self.digital_tile.initialize_tiles(int(self.nbs.currentText()),int(self.nba.currentText()),\
 				self.ac.isChecked(),self.cursor_selections.currentText(),self.click_functions.currentText())
 			if not hasattr(self,'curvelet_structure'):
 				self.digital_tile.WEDGE_REQUESTED.connect(self.click_show_wedge)
 				self.digital_tile.WEDGE_ENTER.connect(self.update_wedge_index)
 				self.digital_tile.WEDGE_CHOSEN.connect(self.update_chosen_wedges)
-			self.curvelet_structure = process.CurveletStructure(self.fdct_worker.struct(self.fdct_worker.fwd(self.image)))
+			self.stop_preview()
+			cache_key = self.transform_cache.key(np.asarray(self.image),self.image_crop,int(self.nbs.currentText()),\
+				int(self.nba.currentText()),self.ac.isChecked(),self.backend.currentText())
+			coefficients = self.transform_cache.load(cache_key)
+			if coefficients is None:
+				with self.profiler.stage('forward'):
+					coefficients = self.fdct_worker.fwd(self.image)
+				error = self.transform_cache.store(cache_key,coefficients)
+				if error is not None:
+					self.update_log('[WARNING] Curvelet coefficients not cached: {}'.format(error))
+			else:
+				self.update_log('[SUCCESS] Curvelet coefficients loaded from cache!')
+			with self.profiler.stage('normstruct'):
+				engine = self.plan.threshold_engine(len(coefficients),self.transform_cache)
+			with self.profiler.stage('statistics'):
+				statistics = process.WedgeStatistics(engine.layout,coefficients)
+			self.curvelet_structure = process.CurveletStructure(process.CoefficientBuffer(coefficients,engine.layout),coefficients,\
+				engine,statistics)
+			self.reconstruction = process.IncrementalReconstruction(self.fdct_worker,self.plan.layout(len(coefficients)),\
+				self.curvelet_structure.original_structure,coefficients)
 			self.curvelet_structure.control_panel.UPDATE_LOG.connect(self.update_log)
-			self.current_status['curvelet_transform'] = (self.nbs.currentText(),self.nba.currentText(),self.ac.isChecked())
+			self.current_status['curvelet_transform'] = (self.nbs.currentText(),self.nba.currentText(),self.ac.isChecked(),\
+				self.backend.currentText())
 			self.apply_threshold_button.setEnabled(True)
+			self.threshold_sweep_button.setEnabled(True)
 			self.load_curvelet_button.setEnabled(False)
+			self.update_heatmap()
 			self.update_log('[SUCCESS] Curvelet structure created!')
 		else:
 			self.update_log('[ERROR] Please load an image first!')
 
 	def threshold_denoise(self):
 		if hasattr(self,'curvelet_structure'):
-			Energy = self.fdct_worker.normstruct()
-			self.curvelet_structure.apply_hard_threshold(Energy,self.threshold_slider.value(),self.digital_tile.chosen_wedge_indices)
-			self.current_status['threshold_denoise'] = (self.threshold_slider.value(),copy.deepcopy(self.digital_tile.chosen_wedge_indices))
+			with self.profiler.stage('threshold'):
+				self.curvelet_structure.apply_threshold(self.threshold_slider.value(),self.digital_tile.chosen_wedge_indices,\
+					self.threshold_mode.currentText())
+			self.current_status['threshold_denoise'] = (self.threshold_slider.value(),copy.deepcopy(self.digital_tile.chosen_wedge_indices),\
+				self.threshold_mode.currentText())
 			self.show_modified_image_button.setEnabled(True)
 			self.apply_threshold_button.setEnabled(False)
-			self.update_log('[SUCCESS] Threshold denoise applied!')
+			self.update_heatmap()
+			self.update_log('[SUCCESS] Threshold denoise applied! ({:.2f} MB retained)'.format(self.curvelet_structure.last_retained_bytes/2**20))
+
+	def threshold_sweep(self):
+		if hasattr(self,'curvelet_structure'):
+			thresholds = np.arange(self.threshold_slider.minimum(),self.threshold_slider.maximum()+1)
+			mode = self.threshold_mode.currentText()
+			retained, error, total = self.curvelet_structure.threshold_sweep(thresholds,self.digital_tile.chosen_wedge_indices,mode)
+			self.sweep_figure.clear()
+			axes = self.sweep_figure.axes
+			axes.plot(thresholds,retained/max(retained[0],1),color='tab:blue',linewidth=1)
+			axes.set_xlabel('Threshold',fontsize=7)
+			axes.set_ylabel('Retained',fontsize=7,color='tab:blue')
+			axes.tick_params(labelsize=6)
+			error_axes = axes.twinx()
+			error_axes.plot(thresholds,error/total if total else error,color='tab:red',linewidth=1)
+			error_axes.set_ylabel('Coefficient error\n(upper bound)',fontsize=7,color='tab:red')
+			error_axes.tick_params(labelsize=6)
+			self.sweep_marker = axes.axvline(self.threshold_slider.value(),color='black',linewidth=0.8,linestyle='--')
+			self.sweep_figure.setVisible(True)
+			self.sweep_figure.draw()
+			axes.set_title('{} thresholding'.format(mode),fontsize=7)
+			self.update_log('[SUCCESS] Threshold sweep computed for {} thresholds ({} thresholding)!'.format(len(thresholds),mode))
 
 	def show_modified(self):
 		if hasattr(self,'fdct_worker'):
-			Ct = self.fdct_worker.vect(self.curvelet_structure.structure)
-			self.image_modified = pilImage.fromarray(self.fdct_worker.inv(Ct)).convert('L')
-			self.image_diff = pilImage.eval(pilChops.difference(self.image, self.image_modified),lambda x: x*self.difference_scale_factor_slider.value())
-			if not hasattr(self,'canvas_modified'):
-				self.canvas_modified = canvas.Canvas(self,self.canvas_config)
-				self.canvas_diff = canvas.Canvas(self,self.canvas_config)
-				self.canvas_modified.set_photo(self.image_worker.pilImg2qPixImg(self.image_modified)) 
-				self.canvas_diff.set_photo(self.image_worker.pilImg2qPixImg(self.image_diff))
-				self.canvas.WHEEL_EVENT.connect(self.canvas_modified.wheelEvent)
-				self.canvas.WHEEL_EVENT.connect(self.canvas_diff.wheelEvent)
-				self.canvas.verticalScrollBar().valueChanged.connect(self.canvas_modified.verticalScrollBar().setValue)
-				self.canvas.horizontalScrollBar().valueChanged.connect(self.canvas_modified.horizontalScrollBar().setValue)
-				self.canvas.verticalScrollBar().rangeChanged.connect(self.canvas_modified.verticalScrollBar().setRange)
-				self.canvas.horizontalScrollBar().rangeChanged.connect(self.canvas_modified.horizontalScrollBar().setRange)
-				self.canvas_modified.verticalScrollBar().valueChanged.connect(self.canvas.verticalScrollBar().setValue)
-				self.canvas_modified.horizontalScrollBar().valueChanged.connect(self.canvas.horizontalScrollBar().setValue)
-				self.canvas_modified.verticalScrollBar().rangeChanged.connect(self.canvas.verticalScrollBar().setRange)
-				self.canvas_modified.horizontalScrollBar().rangeChanged.connect(self.canvas.horizontalScrollBar().setRange)
-				self.canvas.verticalScrollBar().valueChanged.connect(self.canvas_diff.verticalScrollBar().setValue)
-				self.canvas.horizontalScrollBar().valueChanged.connect(self.canvas_diff.horizontalScrollBar().setValue)
-				self.canvas.verticalScrollBar().rangeChanged.connect(self.canvas_diff.verticalScrollBar().setRange)
-				self.canvas.horizontalScrollBar().rangeChanged.connect(self.canvas_diff.horizontalScrollBar().setRange)
-				self.canvas_diff.verticalScrollBar().valueChanged.connect(self.canvas.verticalScrollBar().setValue)
-				self.canvas_diff.horizontalScrollBar().valueChanged.connect(self.canvas.horizontalScrollBar().setValue)
-				self.canvas_diff.verticalScrollBar().rangeChanged.connect(self.canvas.verticalScrollBar().setRange)
-				self.canvas_diff.horizontalScrollBar().rangeChanged.connect(self.canvas.horizontalScrollBar().setRange)
-				self.canvas_modified.WHEEL_EVENT.connect(self.canvas.wheelEvent)
-				self.canvas_modified.WHEEL_EVENT.connect(self.canvas_diff.wheelEvent)
-				self.canvas_diff.WHEEL_EVENT.connect(self.canvas.wheelEvent)
-				self.canvas_diff.WHEEL_EVENT.connect(self.canvas_modified.wheelEvent)
-				self.canvasFrameGrid.addWidget(self.canvas_modified,1)
-				self.canvasFrameGrid.addWidget(self.canvas_diff,1)
-				self.canvas.fit_canvas()
-				self.canvas_modified.fit_canvas()
-				self.canvas_diff.fit_canvas()
-				self.update_log('[SUCCESS] Modified image showed!')
-			else:
-				self.canvas_modified.set_photo(self.image_worker.pilImg2qPixImg(self.image_modified)) 
-				self.canvas_diff.set_photo(self.image_worker.pilImg2qPixImg(self.image_diff))
-				self.update_log('[SUCCESS] Modified image updated!')
+			with self.profiler.stage('vect/inv'):
+				image_modified, dirty = self.reconstruction.update(self.curvelet_structure.structure)
+			if dirty is not None:
+				self.update_log('[SUCCESS] {} wedge(s) re-synthesized!'.format(len(dirty)))
+			self.display_modified(image_modified)
 			self.show_modified_image_button.setEnabled(False)
 		else:
 			self.update_log('[ERROR] Please load the curvelet transform first!')
 
+	def display_modified(self,image_modified):
+		self.image_modified = self.image_worker.window_level(image_modified)
+		self.difference_image.update(np.asarray(self.image),image_modified)
+		self.image_diff = self.difference_image.render(self.difference_scale_factor_slider.value(),self.difference_mode.currentText())
+		with self.profiler.stage('qpixmap'):
+			modified_pixmap = self.image_worker.nparray2qPixImg(self.image_modified)
+			diff_pixmap = self.image_worker.nparray2qPixImg(self.image_diff)
+		if not hasattr(self,'canvas_modified'):
+			self.canvas_modified = canvas.Canvas(self,self.canvas_config)
+			self.canvas_diff = canvas.Canvas(self,self.canvas_config)
+			self.canvas_modified.set_photo(modified_pixmap)
+			self.canvas_diff.set_photo(diff_pixmap)
+			self.canvas.WHEEL_EVENT.connect(self.canvas_modified.wheelEvent)
+			self.canvas.WHEEL_EVENT.connect(self.canvas_diff.wheelEvent)
+			self.canvas.verticalScrollBar().valueChanged.connect(self.canvas_modified.verticalScrollBar().setValue)
+			self.canvas.horizontalScrollBar().valueChanged.connect(self.canvas_modified.horizontalScrollBar().setValue)
+			self.canvas.verticalScrollBar().rangeChanged.connect(self.canvas_modified.verticalScrollBar().setRange)
+			self.canvas.horizontalScrollBar().rangeChanged.connect(self.canvas_modified.horizontalScrollBar().setRange)
+			self.canvas_modified.verticalScrollBar().valueChanged.connect(self.canvas.verticalScrollBar().setValue)
+			self.canvas_modified.horizontalScrollBar().valueChanged.connect(self.canvas.horizontalScrollBar().setValue)
+			self.canvas_modified.verticalScrollBar().rangeChanged.connect(self.canvas.verticalScrollBar().setRange)
+			self.canvas_modified.horizontalScrollBar().rangeChanged.connect(self.canvas.horizontalScrollBar().setRange)
+			self.canvas.verticalScrollBar().valueChanged.connect(self.canvas_diff.verticalScrollBar().setValue)
+			self.canvas.horizontalScrollBar().valueChanged.connect(self.canvas_diff.horizontalScrollBar().setValue)
+			self.canvas.verticalScrollBar().rangeChanged.connect(self.canvas_diff.verticalScrollBar().setRange)
+			self.canvas.horizontalScrollBar().rangeChanged.connect(self.canvas_diff.horizontalScrollBar().setRange)
+			self.canvas_diff.verticalScrollBar().valueChanged.connect(self.canvas.verticalScrollBar().setValue)
+			self.canvas_diff.horizontalScrollBar().valueChanged.connect(self.canvas.horizontalScrollBar().setValue)
+			self.canvas_diff.verticalScrollBar().rangeChanged.connect(self.canvas.verticalScrollBar().setRange)
+			self.canvas_diff.horizontalScrollBar().rangeChanged.connect(self.canvas.horizontalScrollBar().setRange)
+			self.canvas_modified.WHEEL_EVENT.connect(self.canvas.wheelEvent)
+			self.canvas_modified.WHEEL_EVENT.connect(self.canvas_diff.wheelEvent)
+			self.canvas_diff.WHEEL_EVENT.connect(self.canvas.wheelEvent)
+			self.canvas_diff.WHEEL_EVENT.connect(self.canvas_modified.wheelEvent)
+			self.canvasFrameGrid.addWidget(self.canvas_modified,1)
+			self.canvasFrameGrid.addWidget(self.canvas_diff,1)
+			self.canvas.fit_canvas()
+			self.canvas_modified.fit_canvas()
+			self.canvas_diff.fit_canvas()
+			self.update_log('[SUCCESS] Modified image showed!')
+		else:
+			self.canvas_modified.set_photo(modified_pixmap)
+			self.canvas_diff.set_photo(diff_pixmap)
+			self.update_log('[SUCCESS] Modified image updated!')
+
 	def difference_scale_factor_changed(self):
 		self.difference_scale_factor_label.setText('Difference gain ({})'.format(self.difference_scale_factor_slider.value()))
 		if hasattr(self,'canvas_diff'):
-			self.image_diff = pilImage.eval(self.image_diff,lambda x: x*self.difference_scale_factor_slider.value()/self.previous_difference_scale_factor)
-			self.canvas_diff.set_photo(self.image_worker.pilImg2qPixImg(self.image_diff))
-		self.previous_difference_scale_factor = self.difference_scale_factor_slider.value()
+			self.image_diff = self.difference_image.render(self.difference_scale_factor_slider.value(),self.difference_mode.currentText())
+			self.canvas_diff.set_photo(self.image_worker.nparray2qPixImg(self.image_diff))
 
 
 	def threshold_changed(self):
 		self.threshold_label.setText('Threshold ({})'.format(self.threshold_slider.value()))
-		if self.threshold_slider.value() != self.current_status['threshold_denoise'][0]:
+		if not 'threshold_denoise' in self.current_status or self.threshold_slider.value() != self.current_status['threshold_denoise'][0] \
+			or self.threshold_mode.currentText() != self.current_status['threshold_denoise'][2]:
 			self.apply_threshold_button.setEnabled(True)
 		else:
 			self.apply_threshold_button.setEnabled(False)
+		if self.live_preview.isChecked() and hasattr(self,'curvelet_structure'):
+			self.preview_timer.start()
+		if hasattr(self,'sweep_marker'):
+			self.sweep_marker.set_xdata([self.threshold_slider.value()]*2)
+			self.sweep_figure.draw_idle()
+
+	def live_preview_changed(self,state):
+		if self.live_preview.isChecked() and hasattr(self,'curvelet_structure'):
+			self.preview_timer.start()
+		else:
+			self.preview_timer.stop()
+
+	def request_preview(self):
+		if not hasattr(self,'threshold_preview'):
+			self.threshold_preview = process.ThresholdPreview(self.curvelet_structure,self.reconstruction)
+			self.threshold_preview.PREVIEW_READY.connect(self.preview_ready)
+		self.threshold_preview.request(self.threshold_slider.value(),self.digital_tile.chosen_wedge_indices,self.threshold_mode.currentText())
+
+	def preview_ready(self,generation,threshold,wedges,mode,structure,image_modified):
+		if hasattr(self,'threshold_preview') and generation == self.threshold_preview.generation:
+			self.curvelet_structure.structure = structure
+			self.curvelet_structure.last_retained_bytes = structure.retained_bytes
+			self.current_status['threshold_denoise'] = (threshold,wedges,mode)
+			self.apply_threshold_button.setEnabled((self.threshold_slider.value(),self.digital_tile.chosen_wedge_indices,\
+				self.threshold_mode.currentText()) != (threshold,wedges,mode))
+			self.show_modified_image_button.setEnabled(False)
+			self.display_modified(image_modified)
+			self.update_heatmap()
+
+	def stop_preview(self):
+		self.preview_timer.stop()
+		if hasattr(self,'threshold_preview'):
+			self.threshold_preview.stop()
+			del self.threshold_preview
+
+	def export_timings(self):
+		path = QtWidgets.QFileDialog.getSaveFileName(None,"choose save file name","./timings.json",\
+			"JSON (*.json);;CSV (*.csv)")[0]
+		if path:
+			count = self.profiler.export(path)
+			self.update_log('[SUCCESS] {} stage timing(s) exported to {}!'.format(count,path))
+
+	def closeEvent(self,event):
+		self.stop_preview()
+		super(Window,self).closeEvent(event)
 
 	def update_log(self,message):
 	    self.logBox.append(QtCore.QTime.currentTime().toString("hh:mm:ss")+"\u00A0\u00A0\u00A0\u00A0"+message)
@@ -1,5 +1,12 @@
+import collections
+import collections.abc
+import contextlib
+import csv
+import functools
 import glob
+import hashlib
 import itertools
+import json
 import math
 import numpy as np
 import os
@@ -10,17 +17,31 @@ import matplotlib.gridspec as gridspec
 import rawpy
 import random
 import sys
+import threading
 import time
+import tracemalloc
 from dynamic_viewer import CurveletControl
 from math import pi as Pi
-import pyct
+import curvelet
 from PyQt5 import QtCore, QtGui, QtWidgets
+import concurrent.futures
 import copy
+try:
+    import resource
+except ImportError:
+    resource = None
 
 class Image(object):
+    decode_cache = collections.OrderedDict()
+    decode_cache_size = 8
+    decode_cache_lock = threading.Lock()
+    chi_table_cache = collections.OrderedDict()
+    chi_table_cache_size = 32
 
-    def __init__(self):
+    def __init__(self,luminance_precision='float32'):
         super(Image,self).__init__()
+        self.luminance_precision = luminance_precision
+        self._luminance_scratch = None
         self.supportedRawFormats = {'.3fr','.ari','.arw','.srf','.sr2','.bay','.cri','.crw','.cr2','.cr3','.cap','.iiq','.eip', \
                             '.dcs','.dcr','.drf','.k25','.kdc','.dng','.erf','.fff','.mef','.mdc','.mos','.mrw','.nef', \
                             '.nrw','.orf','.pef','.ptx','.pxn','.r3d','.raf','.raw','.rw2','.rwl','.rwz','.srw','.x3f', \
@@ -31,27 +52,20 @@ class Image(object):
                                       '.png','.ppm','.sgi','.tiff','.tif','.xbm','.BMP','.EPS','.GIF','.ICNS','.ICO','.IM','.JPG','.JPEG','.JPEG2000','.MSP','.PCX',\
                                       '.PNG','.PPM','.SGI','.TIFF','.TIF','.XBM'}
 
-    def get_image(self,bit_depth,img_path,EnableAutoWB, Brightness, UserBlack, image_crop,img_type='numpy_array'):
-        pathExtension = os.path.splitext(img_path)[1]
-        if pathExtension in self.supportedRawFormats:
-            img_raw = rawpy.imread(img_path)
-            img_rgb = img_raw.postprocess(demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD, output_bps = bit_depth, use_auto_wb = EnableAutoWB,bright=Brightness/100,user_black=UserBlack)
-            img_bw = (0.21*img_rgb[:,:,0])+(0.72*img_rgb[:,:,1])+(0.07*img_rgb[:,:,2])
-            if image_crop:
-                crop0 = max(0,image_crop[0])
-                crop1 = min(len(img_bw)-1,image_crop[1])
-                crop2 = max(0,image_crop[2])
-                crop3 = min(len(img_bw[0])-1,image_crop[3])
-                img_array = img_bw[crop0:crop1,crop2:crop3]
-            if bit_depth == 16:
-                img_array = np.uint8(img_array/256)
-            if bit_depth == 8:
-                img_array = np.uint8(img_array)
-        elif pathExtension in self.supportedImageFormats:
-            img = pilImage.open(img_path)
-            img_rgb = np.fromstring(img.tobytes(),dtype=np.uint8)
-            img_rgb = img_rgb.reshape((img.size[1],img.size[0],3))
-            img_array = (0.21*img_rgb[:,:,0])+(0.72*img_rgb[:,:,1])+(0.07*img_rgb[:,:,2])
+    def get_image(self,bit_depth,img_path,EnableAutoWB, Brightness, UserBlack, image_crop,img_type='numpy_array',preview=False):
+        key = (os.path.abspath(img_path),os.path.getmtime(img_path),bit_depth,EnableAutoWB,Brightness,UserBlack,\
+               tuple(image_crop) if image_crop else None,preview,self.luminance_precision)
+        with self.decode_cache_lock:
+            img_array = self.decode_cache.get(key)
+            if img_array is not None:
+                self.decode_cache.move_to_end(key)
+        if img_array is None:
+            img_array = self.decode_image(bit_depth,img_path,EnableAutoWB,Brightness,UserBlack,image_crop,preview)
+            img_array.flags.writeable = False
+            with self.decode_cache_lock:
+                self.decode_cache[key] = img_array
+                while len(self.decode_cache) > self.decode_cache_size:
+                    self.decode_cache.popitem(last=False)
         if img_type == 'numpy_array':
             return img_array
         elif img_type == 'pillow_image':
@@ -61,136 +75,190 @@ class Image(object):
         elif img_type == 'QPixmap':
             return self.nparray2qPixImg(img_array)
 
-    def nparray2qPixImg(self,img_array):
-        qImg = QtGui.QImage(np.uint8(img_array),img_array.shape[1],img_array.shape[0],img_array.shape[1], QtGui.QImage.Format_Grayscale8)
-        qPixImg = QtGui.QPixmap(qImg.size())
-        QtGui.QPixmap.convertFromImage(qPixImg,qImg,QtCore.Qt.MonoOnly)
-        return qPixImg
+    def decode_image(self,bit_depth,img_path,EnableAutoWB, Brightness, UserBlack, image_crop,preview=False):
+        pathExtension = os.path.splitext(img_path)[1]
+        if pathExtension in self.supportedRawFormats:
+            with rawpy.imread(img_path) as img_raw:
+                if preview:
+                    img_rgb = img_raw.postprocess(half_size=True, demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR, output_bps = bit_depth, use_auto_wb = EnableAutoWB,bright=Brightness/100,user_black=UserBlack)
+                else:
+                    img_rgb = img_raw.postprocess(demosaic_algorithm=rawpy.DemosaicAlgorithm.AHD, output_bps = bit_depth, use_auto_wb = EnableAutoWB,bright=Brightness/100,user_black=UserBlack)
+            if image_crop:
+                if preview:
+                    image_crop = [value//2 for value in image_crop]
+                crop0 = max(0,image_crop[0])
+                crop1 = min(img_rgb.shape[0]-1,image_crop[1])
+                crop2 = max(0,image_crop[2])
+                crop3 = min(img_rgb.shape[1]-1,image_crop[3])
+                img_rgb = img_rgb[crop0:crop1,crop2:crop3]
+            img_array = self.luminance(img_rgb)
+            if bit_depth == 16:
+                img_array = np.right_shift(img_array,8) if img_array.dtype.kind == 'u' else img_array/256
+            img_array = img_array.astype(np.uint8)
+        elif pathExtension in self.supportedImageFormats:
+            with pilImage.open(img_path) as img:
+                if img.mode == 'L':
+                    img_array = np.asarray(img)
+                    return img_array if self.luminance_precision == 'fixed' else img_array.astype(np.float32)
+                img_rgb = np.asarray(img if img.mode in ('RGB','RGBA','RGBX') else img.convert('RGB'))
+            img_array = self.luminance(img_rgb)
+        return img_array
+
+    def luminance(self,img_rgb,out=None):
+        if self.luminance_precision == 'fixed' and img_rgb.dtype.kind == 'u':
+            accumulator = np.multiply(img_rgb[:,:,0],54,dtype=np.uint32)
+            accumulator += np.multiply(img_rgb[:,:,1],184,dtype=np.uint32)
+            accumulator += np.multiply(img_rgb[:,:,2],18,dtype=np.uint32)
+            accumulator >>= 8
+            if out is None:
+                return accumulator.astype(img_rgb.dtype)
+            np.copyto(out,accumulator,casting='unsafe')
+            return out
+        if out is None:
+            out = np.empty(img_rgb.shape[:2],dtype=np.float32)
+        if self._luminance_scratch is None or self._luminance_scratch.shape != out.shape:
+            self._luminance_scratch = np.empty(out.shape,dtype=np.float32)
+        scratch = self._luminance_scratch
+        np.multiply(img_rgb[:,:,0],np.float32(0.21),out=out,dtype=np.float32,casting='unsafe')
+        np.multiply(img_rgb[:,:,1],np.float32(0.72),out=scratch,dtype=np.float32,casting='unsafe')
+        out += scratch
+        np.multiply(img_rgb[:,:,2],np.float32(0.07),out=scratch,dtype=np.float32,casting='unsafe')
+        out += scratch
+        return out
+
+    def nparray2qPixImg(self,img_array,window=None,level=None):
+        return QtGui.QPixmap.fromImage(self.nparray2qImg(img_array,window,level),QtCore.Qt.MonoOnly)
 
     def pilImg2nparray(self,pilImg):
         return np.asarray(pilImg)
 
     def pilImg2qPixImg(self,pilImg):
-        img_array = np.asarray(pilImg)
-        qImg = QtGui.QImage(np.uint8(img_array),img_array.shape[1],img_array.shape[0],img_array.shape[1], QtGui.QImage.Format_Grayscale8)
-        qPixImg = QtGui.QPixmap(qImg.size())
-        QtGui.QPixmap.convertFromImage(qPixImg,qImg,QtCore.Qt.MonoOnly)
-        return qPixImg
+        return self.nparray2qPixImg(np.asarray(pilImg))
 
     def pilImg2qImg(self,pilImg):
-        img_array = np.asarray(pilImg)
-        qImg = QtGui.QImage(np.uint8(img_array),img_array.shape[1],img_array.shape[0],img_array.shape[1], QtGui.QImage.Format_Grayscale8)
-        return qImg
+        return self.nparray2qImg(np.asarray(pilImg))
     
     def nparray2pilImg(self,img_array):
         return pilImage.fromarray(img_array).convert('L')
 
-    def nparray2qImg(self,img_array):
-        qImg = QtGui.QImage(np.uint8(img_array),img_array.shape[1],img_array.shape[0],img_array.shape[1], QtGui.QImage.Format_Grayscale8)
+    def nparray2qImg(self,img_array,window=None,level=None):
+        if img_array.dtype == np.uint16 and window is None and hasattr(QtGui.QImage,'Format_Grayscale16'):
+            image_format = QtGui.QImage.Format_Grayscale16
+        else:
+            img_array = self.window_level(img_array,window,level)
+            image_format = QtGui.QImage.Format_Grayscale8
+        img_array = np.ascontiguousarray(img_array)
+        qImg = QtGui.QImage(img_array,img_array.shape[1],img_array.shape[0],img_array.strides[0],image_format)
+        qImg.ndarray = img_array
         return qImg
 
+    def window_level(self,img_array,window=None,level=None,out=None):
+        if img_array.dtype == np.uint8 and window is None and out is None:
+            return img_array
+        if window is None:
+            window = 65536 if img_array.dtype == np.uint16 else 256
+            level = window/2
+        elif level is None:
+            level = window/2
+        low, scale = level-window/2, 256/window
+        if out is None:
+            out = np.empty(img_array.shape,dtype=np.uint8)
+        if img_array.dtype in (np.uint8,np.uint16):
+            lut = np.clip((np.arange(np.iinfo(img_array.dtype).max+1)-low)*scale,0,255).astype(np.uint8)
+            np.take(lut,img_array,out=out,mode='clip')
+        else:
+            scratch = np.subtract(img_array,low,dtype=np.float32)
+            scratch *= scale
+            np.clip(scratch,0,255,out=scratch)
+            np.copyto(out,scratch,casting='unsafe')
+        return out
+
     def add_gaussian_noise(self,img,sigma):
         noise = pilChops.Image.eval(pilImage.effect_noise(img.size,sigma), lambda x: x-128)
         img_noisy = pilChops.add(img,noise)
         return img_noisy
 
-    def get_line_scan(self,start,end,img,scale_factor,normalize_to_img_max=True):
+    def sample_bilinear(self,img,x,y):
+        img = np.asarray(img)
+        height, width = img.shape[:2]
+        inside = (x >= 0) & (x <= width-1) & (y >= 0) & (y <= height-1)
+        x = np.clip(x,0,width-1)
+        y = np.clip(y,0,height-1)
+        left = np.minimum(x.astype(np.intp),width-2) if width > 1 else np.zeros(x.shape,dtype=np.intp)
+        top = np.minimum(y.astype(np.intp),height-2) if height > 1 else np.zeros(y.shape,dtype=np.intp)
+        fx, fy = x-left, y-top
+        right, bottom = np.minimum(left+1,width-1), np.minimum(top+1,height-1)
+        upper = img[top,left]*(1-fx)+img[top,right]*fx
+        lower = img[bottom,left]*(1-fx)+img[bottom,right]*fx
+        return np.where(inside,upper*(1-fy)+lower*fy,0)
+
+    def line_samples(self,start,end):
         x0,y0,x1,y1 = start.x(),start.y(),end.x(),end.y()
         K_length = max(int(abs(x1-x0)+1),int(abs(y1-y0)+1))
-        Kx = np.linspace(x0,min(x1,len(img[0])-1),K_length)
-        Ky = np.linspace(y0,min(y1,len(img)-1),K_length)
-        LineScanIntensities = np.zeros(len(Kx))
-        for i in range(0,len(Kx)):
-            try:
-                LineScanIntensities[i] = img[int(Ky[i]),int(Kx[i])]
-            except:
-                pass
-        LineScanRadius = np.linspace(0,math.sqrt((x1-x0)**2+(y1-y0)**2),len(Kx))
-        normalization_factor = np.amax(np.amax(img)) if normalize_to_img_max else 1
+        t = np.linspace(0,1,K_length)
+        return x0+(x1-x0)*t, y0+(y1-y0)*t, np.linspace(0,math.sqrt((x1-x0)**2+(y1-y0)**2),K_length)
+
+    def get_line_scan(self,start,end,img,scale_factor,normalize_to_img_max=True):
+        Kx, Ky, LineScanRadius = self.line_samples(start,end)
+        LineScanIntensities = self.sample_bilinear(img,Kx,Ky)
+        normalization_factor = np.amax(img) if normalize_to_img_max else 1
         return LineScanRadius/scale_factor,LineScanIntensities/normalization_factor
 
     def get_integral(self,start,end,width,img,scale_factor,normalize_to_img_max=True):
-        x0,y0,x1,y1 = start.x(),start.y(),end.x(),end.y()
-        K_length = max(int(abs(x1-x0)+1),int(abs(y1-y0)+1))
-        int_width = int(width)
-        Kx = np.linspace(x0,min(x1,len(img[0])-int_width-1),K_length)
-        Ky = np.linspace(y0,min(y1,len(img)-int_width-1),K_length)
-        LineScanIntensities = np.zeros(len(Kx))
-        LineScanRadius = np.linspace(0,math.sqrt((x1-x0)**2+(y1-y0)**2),len(Kx))
-        if y1 == y0:
-            for i in range (0,len(Kx)): 
-                try:
-                    LineScanIntensities[i] = np.sum(img[int(Ky[i])-int_width:int(Ky[i])+\
-                                        int_width,int(Kx[i])])
-                except:
-                    pass
-        elif x1 == x0:
-            for i in range (0,len(Kx)): 
-                try:
-                    LineScanIntensities[i] = np.sum(img[int(Ky[i]),int(Kx[i])-int_width:\
-                                        int(Kx[i])+int_width])
-                except:
-                    pass
-        else:
-            slope =(x0-x1)/(y1-y0)
-            if abs(slope) > 1:
-                try:
-                    index = np.asarray([[np.linspace(Ky[i]-int_width,Ky[i]+int_width+1,2*int_width+1),\
-                                     np.linspace(Kx[i]-int_width/slope,Kx[i]+(int_width+1)/slope,2*int_width+1)] for i in range(len(Kx))],dtype=int)
-                except:
-                    pass
-            else:
-                try:
-                    index = np.asarray([[np.linspace(Ky[i]-int_width*slope,Ky[i]+(int_width+1)*slope,2*int_width+1),\
-                                     np.linspace(Kx[i]-int_width,Kx[i]+int_width+1,2*int_width+1)] for i in range(len(Kx))],dtype=int)
-                except:
-                    pass
-            try:
-                LineScanIntensities = np.sum([img[index[i,0,:],index[i,1,:]] for i in range(len(Kx))],axis=1)
-            except:
-                pass
-        normalization_factor = np.amax(np.amax(img)) if normalize_to_img_max else 1
-        return LineScanRadius/scale_factor,LineScanIntensities/2/width/normalization_factor
+        Kx, Ky, LineScanRadius = self.line_samples(start,end)
+        length = max(LineScanRadius[-1],1e-12)
+        nx, ny = (start.y()-end.y())/length, (end.x()-start.x())/length
+        offsets = np.arange(-int(width),int(width)+1)
+        X, Y = Kx[:,None]+offsets*nx, Ky[:,None]+offsets*ny
+        samples = self.sample_bilinear(img,X,Y)
+        count = ((X >= 0) & (X <= img.shape[1]-1) & (Y >= 0) & (Y <= img.shape[0]-1)).sum(axis=1)
+        LineScanIntensities = samples.sum(axis=1)/np.maximum(count,1)
+        normalization_factor = np.amax(img) if normalize_to_img_max else 1
+        return LineScanRadius/scale_factor,LineScanIntensities/normalization_factor
 
-    def get_chi_scan(self,center,radius,width,chiRange,tilt,img,chiStep=1,normalize_to_img_max=True):
-        x0,y0 = center.x(),center.y()
-        if int(chiRange/chiStep)>2:
-            ChiTotalSteps = int(chiRange/chiStep)
-        else:
-            ChiTotalSteps = 2
+    def chi_scan_table(self,radius,width,chiRange,tilt,chiStep):
+        key = (radius,width,chiRange,tilt,chiStep)
+        table = self.chi_table_cache.get(key)
+        if table is not None:
+            self.chi_table_cache.move_to_end(key)
+            return table
+        ChiTotalSteps = max(int(chiRange/chiStep),2)
         ChiAngle = np.linspace(-chiRange/2-tilt+90,chiRange/2-tilt+90,ChiTotalSteps+1)
-        ChiAngle2 = np.linspace(-chiRange/2,chiRange/2,ChiTotalSteps+1)
-        x1 = x0 + (radius+width)*np.cos(ChiAngle[1]*np.pi/180)
-        y1 = y0 + (radius+width)*np.sin(ChiAngle[1]*np.pi/180)
-        x2 = x0 + (radius-width)*np.cos(ChiAngle[1]*np.pi/180)
-        y2 = y0 + (radius-width)*np.sin(ChiAngle[1]*np.pi/180)
-        x3 = x0 + (radius-width)*np.cos(ChiAngle[0]*np.pi/180)
-        y3 = y0 + (radius-width)*np.sin(ChiAngle[0]*np.pi/180)
-        x4 = x0 + (radius+width)*np.cos(ChiAngle[0]*np.pi/180)
-        y4 = y0 + (radius+width)*np.sin(ChiAngle[0]*np.pi/180)
-        indices = np.array([[0,0]])
-        cit = 0
-        if ChiAngle[0] <= 90. and ChiAngle[0+1] > 90.:
-            y5 = y0 + radius + width
-        else:
-            y5 = 0
-        for i in range(int(np.amin([y1,y2,y3,y4])),int(np.amax([y1,y2,y3,y4,y5]))+1):
-            for j in range(int(np.amin([x1,x2,x3,x4])),int(np.amax([x1,x2,x3,x4]))+1):
-                if (j-x0)**2+(i-y0)**2 > (radius-width)**2 and\
-                   (j-x0)**2+(i-y0)**2 < (radius+width)**2 and\
-                   (j-x0)/np.sqrt((i-y0)**2+(j-x0)**2) < np.cos(ChiAngle[0]*np.pi/180) and\
-                   (j-x0)/np.sqrt((i-y0)**2+(j-x0)**2) > np.cos(ChiAngle[1]*np.pi/180):
-                       indices = np.append(indices,[[i,j]],axis=0)
-                       cit+=1
-        RotationTensor = np.array([[[-np.sin((theta-ChiAngle[0])*np.pi/180),np.cos((theta-ChiAngle[0])*np.pi/180)],\
-                                    [np.cos((theta-ChiAngle[0])*np.pi/180), np.sin((theta-ChiAngle[0])*np.pi/180)]] for theta in ChiAngle])
-        ImageIndices =np.tensordot(RotationTensor,(indices[1:-1]-[y0,x0]).T,axes=1).astype(int)
-        try:
-            ChiProfile = np.sum([img[ImageIndices[i,1,:]+int(y0),ImageIndices[i,0,:]+int(x0)] for i in range(ChiTotalSteps+1)], axis=1)/cit
-        except IndexError:
-            ChiProfile = []
-        normalization_factor = np.amax(np.amax(img)) if normalize_to_img_max else 1
-        return np.flip(ChiAngle2,axis=0),ChiProfile/normalization_factor
+        step = (ChiAngle[1]-ChiAngle[0]) if chiRange else 1
+        span = min(ChiAngle[-1]+step-ChiAngle[0],360)
+        edges = np.radians(np.concatenate([[ChiAngle[0],ChiAngle[0]+span],np.arange(np.ceil(ChiAngle[0]/90)*90,ChiAngle[0]+span,90)]))
+        corners = np.outer([max(radius-width,0),radius+width],np.exp(1j*edges)).ravel()
+        top, bottom = int(np.floor(corners.imag.min())), int(np.ceil(corners.imag.max()))
+        left, right = int(np.floor(corners.real.min())), int(np.ceil(corners.real.max()))
+        dy, dx = np.mgrid[top:bottom+1,left:right+1]
+        distance = np.hypot(dx,dy)
+        relative = (np.degrees(np.arctan2(dy,dx))-ChiAngle[0])%360
+        annulus = (distance > radius-width) & (distance < radius+width)
+        dy, dx, relative = dy[annulus], dx[annulus], relative[annulus]
+        dy, dx, relative = np.concatenate([dy,dy]), np.concatenate([dx,dx]), np.concatenate([relative,relative+360])
+        bins = np.floor(relative/step).astype(np.intp)
+        mask = bins <= ChiTotalSteps
+        table = dy[mask], dx[mask], bins[mask], ChiTotalSteps+1
+        self.chi_table_cache[key] = table
+        if len(self.chi_table_cache) > self.chi_table_cache_size:
+            self.chi_table_cache.popitem(last=False)
+        return table
+
+    def get_azimuthal_profile(self,center,radius,width,chiRange,tilt,img,chiStep=1):
+        img = np.asarray(img)
+        dy, dx, bins, length = self.chi_scan_table(radius,width,chiRange,tilt,chiStep)
+        y, x = dy+int(round(center.y())), dx+int(round(center.x()))
+        inside = (y >= 0) & (y < img.shape[0]) & (x >= 0) & (x < img.shape[1])
+        bins = bins[inside]
+        total = np.bincount(bins,weights=img[y[inside],x[inside]],minlength=length)
+        counts = np.bincount(bins,minlength=length)
+        profile = np.divide(total,counts,out=np.zeros(length),where=counts > 0)
+        return np.linspace(chiRange/2,-chiRange/2,length), profile, counts
+
+    def get_chi_scan(self,center,radius,width,chiRange,tilt,img,chiStep=1,normalize_to_img_max=True):
+        ChiAngle, ChiProfile, counts = self.get_azimuthal_profile(center,radius,width,chiRange,tilt,img,chiStep)
+        normalization_factor = np.amax(img) if normalize_to_img_max else 1
+        return ChiAngle,ChiProfile/normalization_factor
 
 class Diffraction(object):
 
@@ -219,37 +287,823 @@ class Diffraction(object):
         elif space_group_number == 216:
             return (h+k)%2==0 and (k+l)%2==0 and (h+l)%2==0
 
-class CurveletStructure(QtCore.QObject):
+class WedgeStore(list):
 
     def __init__(self,structure):
+        super(WedgeStore,self).__init__([list(wedges) for wedges in structure])
+        self.base = structure
+        self.modified = set()
+        self.retained_bytes = 0
+
+    def replace(self,i,j,wedge,shared=False):
+        self[i][j] = wedge
+        self.modified.add((i,j))
+        if not shared:
+            self.retained_bytes += wedge.nbytes
+
+class CoefficientBuffer(object):
+
+    def __init__(self,vector,layout):
+        super(CoefficientBuffer,self).__init__()
+        self.vector = vector
+        self.layout = layout
+        counts = collections.Counter(i for i,j in layout.wedges)
+        self.rows = [WedgeRow(self,i,counts[i]) for i in range(len(counts))]
+        self._views = {}
+
+    def wedge(self,i,j):
+        view = self._views.get((i,j))
+        if view is None:
+            view = self._views[(i,j)] = self.layout.reshape(self.vector[self.layout.slice(i,j)],i,j)
+        return view
+
+    def vect(self):
+        return self.vector
+
+    def __getitem__(self,i):
+        return self.rows[i]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class WedgeRow(collections.abc.Sequence):
+
+    def __init__(self,buffer,i,count):
+        super(WedgeRow,self).__init__()
+        self.buffer = buffer
+        self.i = i
+        self.count = count
+
+    def __getitem__(self,j):
+        if j < 0:
+            j += self.count
+        if not 0 <= j < self.count:
+            raise IndexError('wedge index out of range')
+        return self.buffer.wedge(self.i,j)
+
+    def __len__(self):
+        return self.count
+
+class TransformCache(object):
+
+    def __init__(self,config):
+        super(TransformCache,self).__init__()
+        cacheDefault = dict(config['cacheDefault'].items())
+        self.directory = cacheDefault['directory']
+        self.size_limit = int(float(cacheDefault['sizelimitmb'])*2**20)
+
+    def key(self,image,crop,nbs,nba,ac,backend='pyct'):
+        pixels = np.ascontiguousarray(image)
+        digest = hashlib.sha1()
+        digest.update(repr((pixels.shape,pixels.dtype.str,crop,nbs,nba,ac,backend)).encode())
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    def path(self,key):
+        return os.path.join(self.directory,key+'.npy')
+
+    def load(self,key):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            coefficients = np.load(path,mmap_mode='c')
+        except (OSError,ValueError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return coefficients
+
+    def store(self,key,coefficients):
+        path = self.path(key)
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            with open(path+'.tmp','wb') as output:
+                np.save(output,coefficients)
+            os.replace(path+'.tmp',path)
+            self.evict()
+        except OSError as error:
+            if os.path.exists(path+'.tmp'):
+                try:
+                    os.remove(path+'.tmp')
+                except OSError:
+                    pass
+            return error
+        return None
+
+    def normstruct_key(self,n,nbs,nba,ac,backend='pyct'):
+        return 'normstruct-'+hashlib.sha1(repr((tuple(n),int(nbs),int(nba),bool(ac),backend)).encode()).hexdigest()
+
+    def load_normstruct(self,n,nbs,nba,ac,backend='pyct'):
+        table = self.load(self.normstruct_key(n,nbs,nba,ac,backend))
+        if table is None or table.ndim != 2 or table.shape[1] != 2 or not len(table):
+            return None
+        normstruct = [[] for i in range(int(table[-1,0])+1)]
+        for i,norm in table.tolist():
+            normstruct[int(i)].append(norm)
+        return normstruct
+
+    def store_normstruct(self,normstruct,n,nbs,nba,ac,backend='pyct'):
+        table = np.array([(i,norm) for i in range(len(normstruct)) for norm in normstruct[i]],dtype=np.float64)
+        return self.store(self.normstruct_key(n,nbs,nba,ac,backend),table)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                stat = os.stat(os.path.join(self.directory,name))
+                entries.append((stat.st_mtime,stat.st_size,name))
+        entries.sort()
+        total = sum(entry[1] for entry in entries)
+        for mtime,size,name in entries[:-1]:
+            if total <= self.size_limit:
+                break
+            os.remove(os.path.join(self.directory,name))
+            total -= size
+
+class CurveletPlan(object):
+
+    def __init__(self,n,nbs,nba,ac,backend='pyct',cache=None):
+        super(CurveletPlan,self).__init__()
+        self.key = (tuple(n),nbs,nba,ac,backend)
+        self.backend = backend
+        self.cache = cache
+        self.fdct = curvelet.create_fdct(backend,n,nbs,nba,ac)
+        self._normstruct = None
+        self._layout = None
+        self._engine = None
+
+    def normstruct(self,store=None):
+        if self._normstruct is None:
+            if store is not None:
+                self._normstruct = store.load_normstruct(*self.key)
+            if self._normstruct is None:
+                self._normstruct = self.fdct.normstruct()
+                if store is not None:
+                    store.store_normstruct(self._normstruct,*self.key)
+            self.grown()
+        return self._normstruct
+
+    def layout(self,length):
+        if self._layout is None or self._layout.length != length:
+            self._layout = CurveletLayout(self.fdct,length)
+            self.grown()
+        return self._layout
+
+    def threshold_engine(self,length,store=None):
+        if self._engine is None or self._engine.layout is not self.layout(length):
+            self._engine = ThresholdEngine(self.layout(length),self.normstruct(store))
+            self.grown()
+        return self._engine
+
+    def grown(self):
+        if self.cache is not None:
+            self.cache.trim()
+
+    def nbytes(self):
+        size = self.fdct.nbytes() if hasattr(self.fdct,'nbytes') else 0
+        if self._engine is not None:
+            size += self._engine.energy.nbytes+self._engine.norms.nbytes
+        if self._normstruct is not None:
+            size += sum(sys.getsizeof(norms)+8*len(norms) for norms in self._normstruct)
+        if self._layout is not None:
+            size += self._layout.nbytes()
+        return size
+
+class PlanCache(object):
+
+    def __init__(self,max_entries=8,max_bytes=512*2**20):
+        super(PlanCache,self).__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.plans = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def resize(self,max_entries,max_bytes):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def get(self,n,nbs,nba,ac,backend=None):
+        key = (tuple(n),int(nbs),int(nba),bool(ac),backend or curvelet.default_backend())
+        with self.lock:
+            plan = self.plans.pop(key,None)
+            if plan is None:
+                plan = CurveletPlan(*key,cache=self)
+            self.plans[key] = plan
+            self.evict()
+        return plan
+
+    def trim(self):
+        with self.lock:
+            self.evict()
+
+    def evict(self):
+        while len(self.plans) > 1 and (len(self.plans) > self.max_entries or \
+                sum(plan.nbytes() for plan in self.plans.values()) > self.max_bytes):
+            self.plans.popitem(last=False)
+
+plan_cache = PlanCache()
+
+class WedgeExecutor(object):
+
+    def __init__(self,workers=None,chunk_size=2**16):
+        super(WedgeExecutor,self).__init__()
+        self.pool = None
+        self.resize(workers,chunk_size)
+
+    def resize(self,workers,chunk_size):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def chunks(self,ids,sizes,target=None):
+        ends = np.cumsum(sizes)
+        if not len(ends):
+            return []
+        target = target or max(self.chunk_size,-(-int(ends[-1])//(4*self.workers)))
+        groups = (ends-1)//target
+        return np.split(ids,np.flatnonzero(np.diff(groups))+1)
+
+    def map(self,function,ids,sizes):
+        chunks = self.chunks(ids,sizes)
+        if self.pool is None or len(chunks) < 2:
+            return [function(chunk) for chunk in chunks]
+        return list(self.pool.map(function,chunks))
+
+wedge_executor = WedgeExecutor()
+
+class CurveletLayout(object):
+
+    def __init__(self,fdct_worker,length):
+        super(CurveletLayout,self).__init__()
+        probe = fdct_worker.struct(np.arange(length,dtype=np.float64))
+        self.length = length
+        self.order = 'C'
+        self.offsets = {}
+        self.shapes = {}
+        for i in range(len(probe)):
+            for j in range(len(probe[i])):
+                wedge = np.real(probe[i][j])
+                start = int(wedge.flat[0])
+                self.offsets[(i,j)] = (start,start+wedge.size)
+                self.shapes[(i,j)] = wedge.shape
+                if wedge.ndim == 2 and min(wedge.shape) > 1:
+                    self.order = 'F' if int(wedge.ravel(order='F')[1]) == start+1 else 'C'
+        self.wedges = sorted(self.offsets, key=lambda w: self.offsets[w][0])
+        self.index = {wedge:k for k,wedge in enumerate(self.wedges)}
+        self.scales = np.array([i for i,j in self.wedges],dtype=np.intp)
+        self.starts = np.array([self.offsets[wedge][0] for wedge in self.wedges],dtype=np.intp)
+        self.sizes = np.array([self.offsets[wedge][1]-self.offsets[wedge][0] for wedge in self.wedges],dtype=np.intp)
+
+    def slice(self,i,j):
+        return slice(*self.offsets[(i,j)])
+
+    def nbytes(self):
+        size = self.scales.nbytes+self.starts.nbytes+self.sizes.nbytes+sys.getsizeof(self.wedges)
+        for table in (self.offsets,self.shapes,self.index):
+            size += sys.getsizeof(table)+sum(sys.getsizeof(key)+sys.getsizeof(value) for key,value in table.items())
+        return size
+
+    def flatten(self,wedge):
+        return np.ravel(wedge,order=self.order)
+
+    def reshape(self,segment,i,j):
+        return np.reshape(segment,self.shapes[(i,j)],order=self.order)
+
+    def indices(self,ids):
+        sizes = self.sizes[ids]
+        ends = np.cumsum(sizes)
+        total = int(ends[-1]) if len(ends) else 0
+        return np.repeat(self.starts[ids]-(ends-sizes),sizes)+np.arange(total,dtype=np.intp)
+
+class ThresholdEngine(object):
+    MODES = ('hard','soft','garrote')
+
+    def __init__(self,layout,normstruct):
+        super(ThresholdEngine,self).__init__()
+        self.layout = layout
+        self.norms = np.array([normstruct[i][j] for i,j in layout.wedges],dtype=np.float64)
+        self.energy = np.repeat(self.norms,layout.sizes)
+
+    def select(self,wedges=None):
+        if not wedges:
+            return np.flatnonzero(self.layout.scales > 0)
+        scales = [i for i,j in wedges if j is None and i > 0]
+        ids = [self.layout.index[(i,j)] for i,j in wedges if j is not None and i > 0]
+        return np.union1d(np.flatnonzero(np.isin(self.layout.scales,scales)),ids).astype(np.intp)
+
+    def threshold(self,coefficients,threshold,ids,mode='hard',out=None):
+        index = self.layout.indices(ids)
+        values = np.take(coefficients,index,out=out)
+        limit = np.take(self.energy,index)
+        limit *= threshold
+        magnitude = np.abs(values)
+        keep = np.greater(magnitude,limit)
+        if mode == 'hard':
+            values[~keep] = 0
+            return values
+        np.divide(limit,magnitude,out=limit,where=keep)
+        if mode == 'garrote':
+            np.square(limit,out=limit)
+        elif mode != 'soft':
+            raise ValueError('Unknown threshold mode: {}'.format(mode))
+        np.subtract(1,limit,out=limit)
+        limit[~keep] = 0
+        values *= limit
+        return values
+
+    def sweep_table(self,coefficients,ids,mode='hard'):
+        index = self.layout.indices(ids)
+        values = np.take(coefficients,index)
+        energy = np.take(self.energy,index)
+        ratio = np.abs(values)
+        ratio /= energy
+        order = np.argsort(ratio,kind='stable')
+        power = np.abs(values[order])**2
+        energy = energy[order]
+        if mode == 'hard':
+            return ratio[order], np.cumsum(power), None, 0
+        elif mode == 'soft':
+            shrinkage, exponent = np.square(energy), 2
+        elif mode == 'garrote':
+            shrinkage, exponent = np.divide(energy**4,power,out=np.zeros_like(power),where=power > 0), 4
+        else:
+            raise ValueError('Unknown threshold mode: {}'.format(mode))
+        return ratio[order], np.cumsum(power), np.cumsum(shrinkage[::-1])[::-1], exponent
+
+    def sweep(self,table,thresholds):
+        ratio, cumulative, shrinkage, exponent = table
+        thresholds = np.asarray(thresholds,dtype=np.float64)
+        removed = np.searchsorted(ratio,thresholds,side='right')
+        error = np.zeros(len(thresholds))
+        cleared = removed > 0
+        error[cleared] = cumulative[removed[cleared]-1]
+        if shrinkage is not None:
+            kept = removed < len(ratio)
+            error[kept] += thresholds[kept]**exponent*shrinkage[removed[kept]]
+        return len(ratio)-removed, error
+
+class WedgeStatistics(object):
+    BINS = 16
+    FIELDS = ('energy','l2','max_abs','mad','noise','minimum','maximum')
+
+    def __init__(self,layout,coefficients,bins=None,executor=None):
+        super(WedgeStatistics,self).__init__()
+        self.layout = layout
+        self.bins = bins or self.BINS
+        executor = executor or wedge_executor
+        parts = executor.map(functools.partial(self.compute,coefficients),np.arange(len(layout.starts)),layout.sizes)
+        for field in ('energy','max_abs','mad','minimum','maximum','histogram'):
+            setattr(self,field,np.concatenate([part[field] for part in parts]))
+        self.l2 = np.sqrt(self.energy)
+        self.noise = self.mad/0.6745
+
+    def compute(self,coefficients,ids):
+        first, last = ids[0], ids[-1]
+        low = self.layout.starts[first]
+        segment = coefficients[low:self.layout.starts[last]+self.layout.sizes[last]]
+        starts, sizes = self.layout.starts[ids]-low, self.layout.sizes[ids]
+        magnitude = np.abs(segment)
+        real = np.real(segment)
+        part = {'energy':np.add.reduceat(np.square(magnitude),starts),'max_abs':np.maximum.reduceat(magnitude,starts),\
+            'minimum':np.minimum.reduceat(real,starts),'maximum':np.maximum.reduceat(real,starts)}
+        part['mad'] = np.array([self.median(magnitude[start:start+size]) for start,size in zip(starts.tolist(),sizes.tolist())])
+        scale = np.divide(self.bins,part['max_abs'],out=np.zeros(len(ids)),where=part['max_abs'] > 0)
+        magnitude *= np.repeat(scale,sizes)
+        index = np.minimum(magnitude.astype(np.intp),self.bins-1)
+        index += np.repeat(np.arange(len(ids))*self.bins,sizes)
+        part['histogram'] = np.bincount(index,minlength=len(ids)*self.bins).reshape(len(ids),self.bins)
+        return part
+
+    def median(self,values):
+        middle = (len(values)-1)//2
+        ordered = np.partition(values,[middle,len(values)//2])
+        return (ordered[middle]+ordered[len(values)//2])/2
+
+    def get(self,i,j):
+        k = self.layout.index[(i,j)]
+        statistics = {field:float(getattr(self,field)[k]) for field in self.FIELDS}
+        statistics['histogram'] = self.histogram[k]
+        statistics['bin_edges'] = np.linspace(0,self.max_abs[k],self.bins+1)
+        return statistics
+
+    def scale(self,i):
+        ids = np.flatnonzero(self.layout.scales == i)
+        statistics = {field:getattr(self,field)[ids] for field in self.FIELDS}
+        statistics['histogram'] = self.histogram[ids]
+        return statistics
+
+class IncrementalReconstruction(object):
+
+    def __init__(self,fdct_worker,layout,original_structure,coefficients):
+        super(IncrementalReconstruction,self).__init__()
+        self.fdct_worker = fdct_worker
+        self.layout = layout
+        self.original_structure = original_structure
+        self.coefficients = coefficients
+        self.image = None
+        self.applied = {}
+        self.lock = threading.Lock()
+
+    def dirty_wedges(self,structure):
+        candidates = set(self.applied) | getattr(structure,'modified',set())
+        return sorted((i,j) for i,j in candidates if structure[i][j] is not self.applied.get((i,j),self.original_structure[i][j]))
+
+    def update(self,structure):
+        with self.lock:
+            return self._update(structure)
+
+    def vect(self,structure):
+        if isinstance(structure,CoefficientBuffer):
+            return structure.vect()
+        if isinstance(structure,WedgeStore) and isinstance(structure.base,CoefficientBuffer):
+            vector = np.array(structure.base.vect())
+            for i,j in structure.modified:
+                vector[self.layout.slice(i,j)] = self.layout.flatten(structure[i][j])
+            return vector
+        return self.fdct_worker.vect(structure)
+
+    def _update(self,structure):
+        if self.image is None or not (isinstance(structure,WedgeStore) or structure is self.original_structure):
+            self.image = self.fdct_worker.inv(self.vect(structure))
+            self.applied = {w:structure[w[0]][w[1]] for w in getattr(structure,'modified',set())}
+            return self.image, None
+        dirty = self.dirty_wedges(structure)
+        if dirty:
+            delta = {}
+            for i,j in dirty:
+                wedge = structure[i][j]
+                delta[(i,j)] = np.asarray(wedge)-self.applied.get((i,j),self.original_structure[i][j])
+                if wedge is self.original_structure[i][j]:
+                    del self.applied[(i,j)]
+                else:
+                    self.applied[(i,j)] = wedge
+            self.image = self.image+self.synthesize(delta)
+        return self.image, dirty
+
+    def synthesize(self,delta):
+        if hasattr(self.fdct_worker,'synthesize'):
+            return self.fdct_worker.synthesize(delta)
+        vector = np.zeros(self.coefficients.shape,dtype=self.coefficients.dtype)
+        for (i,j),wedge in delta.items():
+            vector[self.layout.slice(i,j)] = self.layout.flatten(wedge)
+        return self.fdct_worker.inv(vector)
+
+class DifferenceImage(object):
+    MODES = ('absolute','signed','log')
+
+    def __init__(self):
+        super(DifferenceImage,self).__init__()
+        self.difference = None
+        self.scratch = None
+        self.display = None
+
+    def update(self,original,modified):
+        if self.difference is None or self.difference.shape != np.shape(original):
+            self.difference = np.empty(np.shape(original),dtype=np.float32)
+            self.scratch = np.empty_like(self.difference)
+            self.display = np.empty(self.difference.shape,dtype=np.uint8)
+        np.subtract(original,np.real(modified),out=self.difference,casting='unsafe')
+
+    def render(self,gain,mode='absolute'):
+        if mode == 'signed':
+            np.multiply(self.difference,gain,out=self.scratch)
+            self.scratch += 128
+        elif mode == 'absolute':
+            np.abs(self.difference,out=self.scratch)
+            self.scratch *= gain
+        elif mode == 'log':
+            np.abs(self.difference,out=self.scratch)
+            self.scratch *= gain
+            np.log1p(self.scratch,out=self.scratch)
+            self.scratch *= 255/np.log1p(255)
+        else:
+            raise ValueError('Unknown difference mode: {}'.format(mode))
+        np.clip(self.scratch,0,255,out=self.scratch)
+        np.copyto(self.display,self.scratch,casting='unsafe')
+        return self.display
+
+class CurveletDenoiser(object):
+
+    def __init__(self,nbs,nba,ac,threshold,wedges=None,mode='hard',backend=None):
+        super(CurveletDenoiser,self).__init__()
+        self.nbs = nbs
+        self.nba = nba
+        self.ac = ac
+        self.threshold = threshold
+        self.wedges = wedges
+        self.mode = mode
+        self.backend = backend
+
+    def run(self,image,timings=None):
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        n = image.size if isinstance(image,pilImage.Image) else image.shape[::-1]
+        plan = plan_cache.get(n,self.nbs,self.nba,self.ac,self.backend)
+        coefficients = plan.fdct.fwd(image)
+        timings['forward'] = time.perf_counter()-start
+        start = time.perf_counter()
+        engine = plan.threshold_engine(len(coefficients))
+        ids = engine.select(self.wedges)
+        denoised = np.array(coefficients)
+        denoised[engine.layout.indices(ids)] = engine.threshold(coefficients,self.threshold,ids,self.mode)
+        timings['threshold'] = time.perf_counter()-start
+        start = time.perf_counter()
+        image_denoised = plan.fdct.inv(denoised)
+        timings['inverse'] = time.perf_counter()-start
+        return image_denoised
+
+class TiledDenoiser(object):
+
+    def __init__(self,denoiser,tile=1024,overlap=128,workers=None):
+        super(TiledDenoiser,self).__init__()
+        if not 0 <= overlap < tile:
+            raise ValueError('The tile overlap must be smaller than the tile size!')
+        self.denoiser = denoiser
+        self.tile = tile
+        self.overlap = overlap
+        self.workers = workers or os.cpu_count() or 1
+
+    def starts(self,length):
+        if length <= self.tile:
+            return [0]
+        starts = list(range(0,length-self.tile+1,self.tile-self.overlap))
+        if starts[-1]+self.tile < length:
+            starts.append(length-self.tile)
+        return starts
+
+    def window(self,length):
+        ramp = min(self.overlap,length//2)
+        window = np.ones(length,dtype=np.float32)
+        if ramp > 0:
+            rise = np.sin(np.pi/2*(np.arange(ramp)+0.5)/ramp)**2
+            window[:ramp] = rise
+            window[length-ramp:] = rise[::-1]
+        return window
+
+    def run(self,img_array,timings=None):
+        height, width = img_array.shape
+        boxes = [(y,min(y+self.tile,height),x,min(x+self.tile,width)) for y in self.starts(height) for x in self.starts(width)]
+        output = np.zeros((height,width),dtype=np.float32)
+        weight = np.zeros((height,width),dtype=np.float32)
+        stage_timings = []
+
+        def denoise_tile(box):
+            y0,y1,x0,x1 = box
+            tile_timings = {}
+            tile = self.denoiser.run(np.ascontiguousarray(img_array[y0:y1,x0:x1]),tile_timings)
+            stage_timings.append(tile_timings)
+            return box,tile
+
+        def accumulate(box,tile):
+            y0,y1,x0,x1 = box
+            window = np.outer(self.window(y1-y0),self.window(x1-x0))
+            output[y0:y1,x0:x1] += window*tile
+            weight[y0:y1,x0:x1] += window
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for box in boxes:
+                if len(pending) >= 2*self.workers:
+                    done, pending = concurrent.futures.wait(pending,return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        accumulate(*future.result())
+                pending.add(executor.submit(denoise_tile,box))
+            for future in concurrent.futures.as_completed(pending):
+                accumulate(*future.result())
+        output /= weight
+        if timings is not None:
+            timings['tiles'] = len(boxes)
+            for stage in ('forward','threshold','inverse'):
+                timings[stage] = sum(tile_timings.get(stage,0) for tile_timings in stage_timings)
+        return output
+
+class StageProfiler(QtCore.QObject):
+    UPDATE_LOG = QtCore.pyqtSignal(str)
+    FIELDS = ['time','stage','seconds','traced_peak_mb','rss_mb','new_peak_rss_mb']
+
+    def __init__(self,trace_memory=False):
+        super(StageProfiler,self).__init__()
+        self.records = []
+        self.lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def max_rss(self):
+        if resource is None:
+            return None
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale
+
+    def rss(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+        except (OSError,ValueError,AttributeError):
+            return None
+
+    @contextlib.contextmanager
+    def stage(self,name):
+        traced = tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        rss_start = self.rss()
+        peak_start = self.max_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'time':time.strftime('%H:%M:%S'),'stage':name,'seconds':time.perf_counter()-start,\
+                'traced_peak_mb':(tracemalloc.get_traced_memory()[1]-traced_start)/2**20 if traced else None,\
+                'rss_mb':(self.rss()-rss_start)/2**20 if rss_start is not None else None,\
+                'new_peak_rss_mb':(self.max_rss()-peak_start)/2**20 if peak_start is not None else None}
+            with self.lock:
+                self.records.append(record)
+            self.UPDATE_LOG.emit(self.format(record))
+
+    def timed(self,name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args,**kwargs):
+                with self.stage(name):
+                    return function(*args,**kwargs)
+            return wrapper
+        return decorator
+
+    def format(self,record):
+        message = '[TIMING] {}: {:.3f} s'.format(record['stage'],record['seconds'])
+        if record['traced_peak_mb'] is not None:
+            message += ', peak +{:.1f} MB'.format(record['traced_peak_mb'])
+        if record['rss_mb'] is not None:
+            message += ', RSS {:+.1f} MB'.format(record['rss_mb'])
+        if record['new_peak_rss_mb']:
+            message += ', new peak RSS +{:.1f} MB'.format(record['new_peak_rss_mb'])
+        return message
+
+    def export(self,path):
+        with self.lock:
+            records = list(self.records)
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path,'w',newline='') as output:
+                writer = csv.DictWriter(output,fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path,'w') as output:
+                json.dump(records,output,indent=1)
+        return len(records)
+
+class ThresholdPreview(QtCore.QObject):
+    PREVIEW_READY = QtCore.pyqtSignal(int,int,object,str,object,object)
+    REQUEST = QtCore.pyqtSignal(int,int,object,str)
+
+    def __init__(self,curvelet_structure,reconstruction):
+        super(ThresholdPreview,self).__init__()
+        self.curvelet_structure = curvelet_structure
+        self.reconstruction = reconstruction
+        self.generation = 0
+        self.thread = QtCore.QThread()
+        self.moveToThread(self.thread)
+        self.REQUEST.connect(self.run)
+        self.thread.finished.connect(self.deleteLater)
+        self.thread.start()
+
+    def request(self,threshold,wedges,mode='hard'):
+        self.generation += 1
+        self.REQUEST.emit(self.generation,threshold,set(wedges),mode)
+        return self.generation
+
+    @QtCore.pyqtSlot(int,int,object,str)
+    def run(self,generation,threshold,wedges,mode):
+        if generation != self.generation:
+            return
+        structure = self.curvelet_structure.threshold(threshold,wedges,mode)
+        if generation != self.generation:
+            return
+        image, dirty = self.reconstruction.update(structure)
+        if generation == self.generation:
+            self.PREVIEW_READY.emit(generation,threshold,wedges,mode,structure,image)
+
+    def stop(self):
+        self.generation += 1
+        self.thread.quit()
+        self.thread.wait()
+
+class CurveletStructure(QtCore.QObject):
+    HEATMAPS = ('energy','retained fraction')
+
+    def __init__(self,structure,coefficients,engine,statistics=None,executor=None):
         super(CurveletStructure,self).__init__()
         self.original_structure = structure
+        self.coefficients = coefficients
+        self.engine = engine
+        self.executor = executor or wedge_executor
+        self.statistics = statistics if statistics is not None else WedgeStatistics(engine.layout,coefficients,executor=self.executor)
         self.structure = structure
+        self.last_retained_bytes = 0
+        self._sweep_table = (None,None)
+        self._thresholded = {}
+        self._zeros = {}
+        self.lock = threading.Lock()
         self.control_panel = CurveletControl()
 
     def size(self):
         nor,noc = len(self.structure),max(len(self.structure[i]) for i in range(len(self.structure)))
         return nor, noc
 
-    def apply_hard_threshold(self,energy,threshold,wedges=None):
-        nor = len(self.structure)
-        new_structure = copy.deepcopy(self.original_structure)
-        if not wedges:
-            for i in range(nor):
-                for j in range(len(self.structure[i])):
-                    if i == 0:
-                        mask = 1
-                    else:
-                        mask = (abs(self.original_structure[i][j])>threshold*energy[i][j])*1
-                    new_structure[i][j] = self.original_structure[i][j]*mask
-        else:
-            for i,j in wedges:
-                if i == 0:
-                    mask = 1
-                else:
-                    mask = (abs(self.original_structure[i][j])>threshold*energy[i][j])*1
-                new_structure[i][j] = self.original_structure[i][j]*mask
-        self.structure = new_structure
+    def apply_threshold(self,threshold,wedges=None,mode='hard'):
+        self.structure = self.threshold(threshold,wedges,mode)
+        self.last_retained_bytes = self.structure.retained_bytes
+
+    def zeros(self,shape):
+        with self.lock:
+            zeros = self._zeros.get(shape)
+            if zeros is None:
+                zeros = self._zeros[shape] = np.zeros(shape,dtype=self.coefficients.dtype)
+                zeros.flags.writeable = False
+        return zeros
+
+    def threshold(self,threshold,wedges=None,mode='hard'):
+        new_structure = WedgeStore(self.original_structure)
+        ids = self.engine.select(wedges)
+        layout = self.engine.layout
+        cleared = self.statistics.max_abs[ids] <= threshold*self.engine.norms[ids]
+        for k in ids[cleared].tolist():
+            i,j = layout.wedges[k]
+            new_structure.replace(i,j,self.zeros(layout.shapes[(i,j)]),shared=True)
+        ids = ids[~cleared]
+        with self.lock:
+            previous = {layout.wedges[k]:self._thresholded.get(layout.wedges[k]) for k in ids.tolist()}
+        reused = np.array([entry is not None and entry[:2] == (threshold,mode) for entry in previous.values()],dtype=bool)
+        thresholded = {}
+        for k in ids[reused].tolist():
+            i,j = layout.wedges[k]
+            thresholded[(i,j)] = previous[(i,j)]
+            new_structure.replace(i,j,previous[(i,j)][2],shared=True)
+        ids = ids[~reused]
+        sizes = layout.sizes[ids]
+        ends = np.cumsum(sizes)
+        values = np.empty(int(ends[-1]) if len(ends) else 0,dtype=self.coefficients.dtype)
+        starts = dict(zip(ids.tolist(),(ends-sizes).tolist()))
+        def threshold_chunk(chunk):
+            for block in self.executor.chunks(chunk,layout.sizes[chunk],self.executor.chunk_size):
+                start = starts[int(block[0])]
+                self.engine.threshold(self.coefficients,threshold,block,mode,out=values[start:start+int(layout.sizes[block].sum())])
+        self.executor.map(threshold_chunk,ids,sizes)
+        for k,start,end in zip(ids.tolist(),(ends-sizes).tolist(),ends.tolist()):
+            i,j = layout.wedges[k]
+            wedge = layout.reshape(values[start:end],i,j)
+            wedge.flags.writeable = False
+            thresholded[(i,j)] = (threshold,mode,wedge)
+            new_structure.replace(i,j,wedge)
+        with self.lock:
+            self._thresholded = thresholded
+        return new_structure
+
+    def threshold_sweep(self,thresholds,wedges=None,mode='hard'):
+        ids = self.engine.select(wedges)
+        key = (tuple(ids),mode)
+        if self._sweep_table[0] != key:
+            self._sweep_table = (key,self.engine.sweep_table(self.coefficients,ids,mode))
+        retained, error = self.engine.sweep(self._sweep_table[1],thresholds)
+        total = self.statistics.energy[ids].sum()
+        return retained, error, total
+
+    def retained_fraction(self,threshold,wedges=None):
+        layout = self.engine.layout
+        fraction = np.ones(len(layout.wedges))
+        ids = self.engine.select(wedges)
+        def count(chunk):
+            index = layout.indices(chunk)
+            keep = np.greater(np.abs(np.take(self.coefficients,index)),np.take(self.engine.energy,index)*threshold)
+            return np.add.reduceat(keep,np.cumsum(layout.sizes[chunk])-layout.sizes[chunk],dtype=np.intp)
+        parts = self.executor.map(count,ids,layout.sizes[ids])
+        if parts:
+            fraction[ids] = np.concatenate(parts)/layout.sizes[ids]
+        return fraction
+
+    def heatmap(self,mode,threshold=None,wedges=None):
+        if mode == 'energy':
+            energy = np.log10(np.maximum(self.statistics.energy,np.finfo(np.float64).tiny))
+            span = np.ptp(energy)
+            return (energy-energy.min())/span if span > 0 else np.zeros(len(energy))
+        elif mode == 'retained fraction':
+            return self.retained_fraction(threshold,wedges) if threshold is not None else np.ones(len(self.statistics.energy))
+        raise ValueError('Unknown heatmap mode: {}'.format(mode))
 
     def show_wedge(self,i,j,interactive):
         if not interactive:
@@ -261,7 +1115,8 @@ class CurveletStructure(QtCore.QObject):
         else:
             if not hasattr(self,'control_panel'):
                 self.control_panel = CurveletControl()
-            self.control_panel.add_wedge(self.structure,i,j)
+            statistics = self.statistics.get(i,j) if self.structure[i][j] is self.original_structure[i][j] else None
+            self.control_panel.add_wedge(self.structure,i,j,statistics)
     
     def close_all(self):
         plt.close('all')
@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+import curvelet
+
+CASES = [((72,56),3,8,True),((96,80),4,16,True),((96,80),4,16,False),((128,128),4,32,True)]
+
+class WrappingCurveletTest(unittest.TestCase):
+
+    def test_wedge_counts_follow_digital_tile(self):
+        for n,nbs,nba,ac in CASES:
+            fdct = curvelet.create_fdct('wrapping',n,nbs,nba,ac)
+            counts = [len(row) for row in fdct.struct(fdct.fwd(np.zeros((n[1],n[0]))))]
+            expected = [1]+[nba*2**(i//2) for i in range(1,nbs)]
+            if not ac:
+                expected[-1] = 1
+            self.assertEqual(counts,expected)
+
+    def test_inverse_reconstructs_image(self):
+        for n,nbs,nba,ac in CASES:
+            fdct = curvelet.create_fdct('wrapping',n,nbs,nba,ac)
+            image = np.random.default_rng(0).normal(size=(n[1],n[0]))
+            coefficients = fdct.fwd(image)
+            self.assertAlmostEqual(np.sum(coefficients**2)/np.sum(image**2),1,places=10)
+            np.testing.assert_allclose(fdct.inv(coefficients),image,atol=1e-10)
+
+    def test_synthesize_matches_inverse(self):
+        fdct = curvelet.create_fdct('wrapping',(96,80),4,16,True)
+        structure = fdct.struct(fdct.fwd(np.random.default_rng(1).normal(size=(80,96))))
+        wedges = {(0,0):structure[0][0],(2,5):structure[2][5],(3,17):structure[3][17]}
+        vector = np.zeros(fdct.offsets[-1])
+        single = fdct.struct(vector)
+        for (i,j),wedge in wedges.items():
+            single[i][j][...] = wedge
+        np.testing.assert_allclose(fdct.synthesize(wedges),fdct.inv(fdct.vect(single)),atol=1e-12)
+
+@unittest.skipIf(curvelet.pyct is None,'pyct is not installed')
+class PyctParityTest(unittest.TestCase):
+
+    def test_layout_and_orientation_match_pyct(self):
+        for n,nbs,nba,ac in CASES:
+            report = curvelet.compare_with_pyct(n,nbs,nba,ac)
+            self.assertTrue(report['scales'],(n,nbs,nba,ac))
+            self.assertTrue(report['wedges'],(n,nbs,nba,ac))
+            self.assertEqual(report['mismatched'],[],(n,nbs,nba,ac))
+            self.assertEqual(report['transposed'],0,(n,nbs,nba,ac))
+            self.assertLess(report['coefficients'],1e-6,(n,nbs,nba,ac))
+
+if __name__ == '__main__':
+    unittest.main()